@@ -0,0 +1,197 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from Evaluator import PAD, WINDOW, CENTER, board_windows, evaluate_windows, evaluate_boards, line_indices
+from Logic import NEAR_RADIUS, QUICK_AI_SCORES, QUICK_PLAYER_SCORES
+from Patterns import PATTERN_TABLES, CENTER_SHIFT, FIVE, OPEN_FOUR
+from Threats import WIN_SCORE
+
+# Moves searched per node, the ones GomokuLogic._scored_relevant_moves keeps
+TOP_MOVES = 12
+# Board cells over all the leaves one chunk of positions may expand to; bounds the
+# memory of a batch and sets how many positions a pool worker gets at a time
+LEAF_CELLS = 1 << 20
+
+_cell_windows = {}
+
+
+def cell_windows(size):
+    """Per cell in row-major order, the flat indices of the four board_windows windows centred on it"""
+    if size not in _cell_windows:
+        lines = line_indices(size)
+        width = size + 2 * PAD
+        centers = lines[:, CENTER:CENTER + lines.shape[1] - WINDOW + 1].ravel()
+        rows, cols = centers // width - PAD, centers % width - PAD
+        inside = np.flatnonzero((rows >= 0) & (rows < size) & (cols >= 0) & (cols < size))
+        # Lines come one direction after another, so a stable sort keeps each cell's in direction order
+        order = np.argsort(rows[inside] * size + cols[inside], kind="stable")
+        _cell_windows[size] = inside[order].reshape(size * size, 4)
+    return _cell_windows[size]
+
+
+def scan(boards):
+    """One vectorised pass over a (count, size, size) stack with the AI (2) to move
+
+    Returns the static evaluation, the winner (0 if none) and per cell, flat
+    in row-major order: quick_evaluate_move's score and whether a stone there
+    completes five or makes an open four, for each player.
+    """
+    count, size = boards.shape[0], boards.shape[1]
+    codes, centers = board_windows(boards)
+    cells = cell_windows(size)
+    empty = centers == 0
+    winners = np.zeros(count, dtype=np.int64)
+    quick = 0
+    fives = [None, None, None]
+    open_fours = [None, None, None]
+    for player, weights in ((1, QUICK_PLAYER_SCORES), (2, QUICK_AI_SCORES)):
+        table = np.frombuffer(PATTERN_TABLES[player], dtype=np.uint8)
+        winners[((centers == player) & (table[codes] == FIVE)).any(axis=(1, 2))] = player
+        # Class of a player stone on each empty window centre
+        moves = np.where(empty, table[(codes & ~(3 << CENTER_SHIFT)) | (player << CENTER_SHIFT)], 0)
+        moves = moves.reshape(count, -1)[:, cells]
+        quick = quick + np.asarray(weights)[moves].sum(axis=2)
+        fives[player] = (moves == FIVE).any(axis=2)
+        open_fours[player] = (moves == OPEN_FOUR).any(axis=2)
+    quick = np.where(fives[2], 1000000, quick)
+    return evaluate_windows(codes), winners, quick, fives, open_fours
+
+
+def candidates(boards):
+    """Empty cells within NEAR_RADIUS of a stone, as (count, size, size) masks; the centre on an empty board"""
+    count, size = boards.shape[0], boards.shape[1]
+    stones = np.zeros((count, size + 2 * NEAR_RADIUS, size + 2 * NEAR_RADIUS), dtype=bool)
+    stones[:, NEAR_RADIUS:NEAR_RADIUS + size, NEAR_RADIUS:NEAR_RADIUS + size] = boards != 0
+    near = np.zeros((count, size, size), dtype=bool)
+    for dr in range(2 * NEAR_RADIUS + 1):
+        for dc in range(2 * NEAR_RADIUS + 1):
+            near |= stones[:, dr:dr + size, dc:dc + size]
+    near &= boards == 0
+    near[~stones.any(axis=(1, 2)), size // 2, size // 2] = True
+    return near
+
+
+def _play(boards, moves, player):
+    """Copies of boards with player's stone on each board's flat cell in moves"""
+    children = boards.copy()
+    children.reshape(len(boards), -1)[np.arange(len(boards)), moves] = player
+    return children
+
+
+def _top_moves(boards, quick):
+    """The TOP_MOVES candidates of each board by quick score, as flat cells, and which of them exist"""
+    scores = np.where(candidates(boards).reshape(len(boards), -1), quick, -1)
+    # A stable sort keeps row-major order among equal scores, as the frontier does
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :TOP_MOVES]
+    return order, np.take_along_axis(scores, order, axis=1) >= 0
+
+
+def _values(boards, depth, player):
+    """Minimax value for the AI of each board with player to move and depth plies left
+
+    Every node searches its top moves at full width, level by level over
+    the whole stack; a board with five in a row or no candidates is a leaf.
+    A side to move with a five to complete scores WIN_SCORE, as minimax's
+    VCF check gives it.
+    """
+    if depth == 0:
+        return evaluate_boards(boards)
+    values, winners, quick, fives, _ = scan(boards)
+    five_to_play = (winners == 0) & fives[player].any(axis=1)
+    values[five_to_play] = WIN_SCORE if player == 2 else -WIN_SCORE
+    inner = np.flatnonzero((winners == 0) & ~five_to_play)
+    if not len(inner):
+        return values
+    moves, exists = _top_moves(boards[inner], quick[inner])
+    rows, slots = np.nonzero(exists)
+    children = _play(boards[inner][rows], moves[rows, slots], player)
+    child_values = _values(children, depth - 1, 3 - player)
+    best = np.full(moves.shape, np.iinfo(np.int64).min if player == 2 else np.iinfo(np.int64).max)
+    best[rows, slots] = child_values
+    reduced = best.max(axis=1) if player == 2 else best.min(axis=1)
+    has_moves = exists.any(axis=1)
+    values[inner[has_moves]] = reduced[has_moves]
+    return values
+
+
+def _forced_moves(boards, scanned):
+    """find_best_move's checks before its search: win, block a five, open four, block an open three
+
+    The first such cell in row-major order per board, -1 where none applies.
+    """
+    _, _, _, fives, open_fours = scanned
+    forced = np.full(len(boards), -1)
+    # Later checks only fill boards the earlier ones left open
+    for mask in (fives[2], fives[1], open_fours[2], open_fours[1]):
+        open_boards = (forced < 0) & mask.any(axis=1)
+        forced[open_boards] = mask[open_boards].argmax(axis=1)
+    return forced
+
+
+def _analyze_chunk(boards, depth):
+    """analyze for a stack already coloured with the side to move as 2"""
+    count, size = boards.shape[0], boards.shape[1]
+    scanned = scan(boards)
+    values, winners = scanned[0].copy(), scanned[1]
+    moves = np.full(count, -1)
+    full = (boards != 0).reshape(count, -1).all(axis=1)
+    live = (winners == 0) & ~full
+    forced = _forced_moves(boards, scanned)
+
+    # Searched boards: the best of their top moves, the first one on a tie
+    search = np.flatnonzero(live & (forced < 0))
+    if len(search):
+        quick = scanned[2][search]
+        top, exists = _top_moves(boards[search], quick)
+        rows, slots = np.nonzero(exists)
+        child_values = _values(_play(boards[search][rows], top[rows, slots], 2), depth - 1, 1)
+        table = np.full(top.shape, np.iinfo(np.int64).min)
+        table[rows, slots] = child_values
+        best = table.argmax(axis=1)
+        moves[search] = top[np.arange(len(search)), best]
+        values[search] = table[np.arange(len(search)), best]
+
+    # Forced boards: the value of the forced move searched to the same depth
+    forced_boards = np.flatnonzero(live & (forced >= 0))
+    if len(forced_boards):
+        moves[forced_boards] = forced[forced_boards]
+        values[forced_boards] = _values(_play(boards[forced_boards], forced[forced_boards], 2), depth - 1, 1)
+
+    result = np.full((count, 2), -1)
+    played = moves >= 0
+    result[played, 0], result[played, 1] = np.divmod(moves[played], size)
+    return result, values
+
+
+def analyze(boards, depth=2, player=None, workers=1):
+    """Best move and its minimax value for every board of a (count, size, size) stack
+
+    player is the side to move, a scalar or one per board; by default it is
+    whoever has fewer stones, player 1 on a tie. Boards are searched as
+    find_best_move would with that side as the AI, without its opening book
+    and VCF/VCT search: the same early checks, then minimax over the top
+    moves of every node, vectorised over the whole stack one level at a
+    time. Values are for the side to move. A board that is won or full
+    gets the move (-1, -1) and its static evaluation. With several workers
+    the chunks of a large stack are searched in a process pool.
+    """
+    boards = np.asarray(boards, dtype=np.int64)
+    if boards.ndim != 3 or boards.shape[1] != boards.shape[2]:
+        raise ValueError(f"Need a (count, size, size) stack, got shape {boards.shape}")
+    if depth < 1:
+        raise ValueError(f"Need a depth of at least 1, got {depth}")
+    if player is None:
+        player = np.where((boards == 1).sum(axis=(1, 2)) > (boards == 2).sum(axis=(1, 2)), 2, 1)
+    # The search always moves for 2, so swap the colours where 1 is to move
+    swap = np.broadcast_to(np.asarray(player) == 1, (len(boards),))
+    boards = np.where(swap[:, None, None] & (boards != 0), 3 - boards, boards)
+
+    per_chunk = max(1, LEAF_CELLS // (boards.shape[1] ** 2 * TOP_MOVES ** depth))
+    chunks = [boards[start:start + per_chunk] for start in range(0, len(boards), per_chunk)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_analyze_chunk, chunks, [depth] * len(chunks)))
+    else:
+        results = [_analyze_chunk(chunk, depth) for chunk in chunks]
+    if not results:
+        return np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate([moves for moves, _ in results]), np.concatenate([values for _, values in results])
@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from Logic import GomokuLogic
+
+# Positions with the AI (player 2) to move; moves alternate starting with player 1
+DEFAULT_SUITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_positions.json")
+# A run is flagged when its NPS falls more than this fraction below the baseline's
+NPS_TOLERANCE = 0.10
+
+
+def timed_search(logic, depth, time_limit_ms=None):
+    """find_best_move with the counters a benchmark reports for it, and SearchStats if enabled"""
+    table = logic.transposition_table
+    probes, hits, stores = table.probes, table.hits, table.stores
+    threat_nodes = logic.threat_solver.nodes
+    start = time.perf_counter()
+    move = logic.find_best_move(depth=depth, time_limit_ms=time_limit_ms)
+    seconds = time.perf_counter() - start
+    record = {
+        "move": list(move) if move else None,
+        "seconds": seconds,
+        "nodes": logic.nodes,
+        "depth": logic.completed_depth,
+        "reused_depth": logic.reused_depth,
+        "nps": logic.nodes / seconds if seconds else 0.0,
+        "threat_nodes": logic.threat_solver.nodes - threat_nodes,
+        "tt_probes": table.probes - probes,
+        "tt_hits": table.hits - hits,
+        "tt_stores": table.stores - stores,
+    }
+    if logic.stats:
+        record["stats"] = logic.stats.report()
+    return record
+
+
+def summarize(records):
+    nodes = sum(r["nodes"] for r in records)
+    seconds = sum(r["seconds"] for r in records)
+    probes = sum(r["tt_probes"] for r in records)
+    return {
+        "moves": len(records),
+        "nodes": nodes,
+        "seconds": seconds,
+        "nps": nodes / seconds if seconds else 0.0,
+        "seconds_per_move": seconds / len(records) if records else 0.0,
+        "mean_depth": sum(r["depth"] for r in records) / len(records) if records else 0.0,
+        # Time-limited moves that skipped iterations by carrying on from the previous search or a ponder
+        "reuse_rate": sum(r["reused_depth"] > 0 for r in records) / len(records) if records else 0.0,
+        "tt_hit_rate": sum(r["tt_hits"] for r in records) / probes if probes else 0.0,
+    }
+
+
+def new_engine(size, stats=False, **options):
+    logic = GomokuLogic(size=size, **options)
+    if stats:
+        logic.enable_stats()
+    return logic
+
+
+def run_suite(positions, depth, time_limit_ms=None, **options):
+    """Search every stored position once from a fresh engine"""
+    records = []
+    for index, position in enumerate(positions):
+        logic = new_engine(position.get("size", 10), **options)
+        for i, (row, col) in enumerate(position["moves"]):
+            logic.make_move(row, col, 1 if i % 2 == 0 else 2)
+        record = timed_search(logic, depth, time_limit_ms)
+        record["id"] = position.get("name", str(index))
+        records.append(record)
+        logic.close()
+    return records
+
+
+def self_play(games, depth, time_limit_ms=None, seed=0, opening_moves=4, size=10, max_moves=None, **options):
+    """Play engine against engine; the first opening_moves stones are random so games differ
+
+    Both sides run find_best_move, which always plays as player 2, so the
+    engine for player 1 keeps the board with the colours swapped.
+    """
+    rng = random.Random(seed)
+    records = []
+    results = []
+    for game in range(games):
+        engines = {2: new_engine(size, **options), 1: new_engine(size, **options)}
+        moves = []
+        winner = None
+        player = 1
+        while len(moves) < (max_moves or size * size):
+            if len(moves) < opening_moves:
+                center = size // 2
+                move = (center + rng.randint(-2, 2), center + rng.randint(-2, 2))
+                if not engines[2].is_valid_move(*move):
+                    continue
+            else:
+                record = timed_search(engines[player], depth, time_limit_ms)
+                record["id"] = f"game{game}.{len(moves)}"
+                records.append(record)
+                move = tuple(record["move"])
+            engines[2].make_move(move[0], move[1], player)
+            engines[1].make_move(move[0], move[1], 3 - player)
+            moves.append(list(move))
+            if engines[2].check_winner(player, move):
+                winner = player
+                break
+            player = 3 - player
+        results.append({"moves": moves, "winner": winner})
+        for engine in engines.values():
+            engine.close()
+    return records, results
+
+
+def load_suite(path):
+    with open(path) as f:
+        suite = json.load(f)
+    return [dict(position, size=suite.get("size", 10)) for position in suite["positions"]]
+
+
+def compare(baseline, current, tolerance=NPS_TOLERANCE):
+    """NPS regressions and changed moves of current against baseline, as a list of messages"""
+    problems = []
+    for section in ("suite", "self_play"):
+        if section not in baseline or section not in current:
+            continue
+        old, new = baseline[section], current[section]
+        old_nps, new_nps = old["summary"]["nps"], new["summary"]["nps"]
+        if old_nps and new_nps < old_nps * (1 - tolerance):
+            problems.append(f"{section}: NPS {old_nps:.0f} -> {new_nps:.0f} ({new_nps / old_nps - 1:+.1%})")
+        old_moves = {r["id"]: r["move"] for r in old["records"]}
+        for record in new["records"]:
+            if record["id"] in old_moves and old_moves[record["id"]] != record["move"]:
+                problems.append(f"{section}: {record['id']} move {old_moves[record['id']]} -> {record['move']}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless Gomoku engine benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="search the position suite and play self-play games")
+    run.add_argument("--depth", type=int, default=3)
+    run.add_argument("--time-limit-ms", type=int, help="search with iterative deepening instead of a fixed depth")
+    run.add_argument("--suite", default=DEFAULT_SUITE)
+    run.add_argument("--games", type=int, default=2)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--size", type=int, default=10, help="board size of the self-play games")
+    run.add_argument("--workers", type=int, default=1)
+    run.add_argument("--search", default="minimax", help="minimax, pvs or mcts")
+    run.add_argument("--rollouts", type=int, help="MCTS playouts per move without --time-limit-ms")
+    run.add_argument("--book", action="store_true", help="answer early positions from the opening book")
+    run.add_argument("--stats", action="store_true", help="add SearchStats counters to every move (slower)")
+    run.add_argument("--out", help="write the JSON here instead of stdout")
+    check = commands.add_parser("compare", help="flag NPS regressions and move changes between two runs")
+    check.add_argument("baseline")
+    check.add_argument("current")
+    check.add_argument("--tolerance", type=float, default=NPS_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        problems = compare(baseline, current, args.tolerance)
+        for problem in problems:
+            print(problem)
+        print(f"{len(problems)} problem(s)")
+        return 1 if problems else 0
+
+    options = {"workers": args.workers, "search": args.search, "stats": args.stats}
+    if not args.book:
+        options["opening_book"] = None
+    if args.rollouts:
+        options["rollouts"] = args.rollouts
+    report = {"depth": args.depth, "time_limit_ms": args.time_limit_ms, "size": args.size, "options": options}
+    if args.suite:
+        records = run_suite(load_suite(args.suite), args.depth, args.time_limit_ms, **options)
+        report["suite"] = {"summary": summarize(records), "records": records}
+    if args.games:
+        records, games = self_play(args.games, args.depth, args.time_limit_ms, args.seed, size=args.size, **options)
+        report["self_play"] = {"summary": summarize(records), "records": records, "games": games}
+    output = json.dumps(report, indent=1)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
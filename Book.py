@@ -0,0 +1,147 @@
+import argparse
+import os
+import struct
+import time
+
+# Replies for early positions, found offline by a deep search. The file holds a
+# header and then one (key, cell) record per position with the AI to move,
+# sorted by key; the cell is row * size + col in the key's symmetry frame.
+DEFAULT_BOOK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+BOOK_MAGIC = b"GMKB"
+BOOK_VERSION = 1
+HEADER = struct.Struct("<4sBBBI")  # magic, version, board size, most stones in a position, records
+RECORD = struct.Struct("<QH")
+
+_books = {}
+
+
+def symmetries(size):
+    """The 8 rotations and reflections of a size x size board, as (row, col) -> (row, col) functions"""
+    n = size - 1
+    return [
+        lambda r, c: (r, c),
+        lambda r, c: (c, n - r),
+        lambda r, c: (n - r, n - c),
+        lambda r, c: (n - c, r),
+        lambda r, c: (r, n - c),
+        lambda r, c: (n - r, c),
+        lambda r, c: (c, r),
+        lambda r, c: (n - c, n - r),
+    ]
+
+
+# INVERSE[k] undoes symmetry k
+INVERSE = [0, 3, 2, 1, 4, 5, 6, 7]
+
+
+def canonical_key(stones, size, keys):
+    """(Zobrist key, symmetry) of the smallest key among the 8 symmetric images of stones
+
+    stones holds (row, col, player) and keys is the fixed-seed table from
+    Logic.zobrist_table, so a key means the same position in every process.
+    """
+    best = None
+    for index, transform in enumerate(symmetries(size)):
+        key = 0
+        for row, col, player in stones:
+            r, c = transform(row, col)
+            key ^= keys[player][r][c]
+        if best is None or key < best[0]:
+            best = (key, index)
+    return best
+
+
+class OpeningBook:
+    def __init__(self, size, entries=None, max_stones=0):
+        self.size = size
+        self.entries = entries or {}  # canonical key -> cell in the canonical frame
+        self.max_stones = max_stones
+
+    @classmethod
+    def load(cls, path=DEFAULT_BOOK):
+        """The book stored at path, read once per process; a missing file gives an empty book"""
+        if path not in _books:
+            book = None
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    data = f.read()
+                magic, version, size, max_stones, count = HEADER.unpack_from(data)
+                if magic != BOOK_MAGIC or version != BOOK_VERSION:
+                    raise ValueError(f"{path} is not a version {BOOK_VERSION} opening book")
+                entries = dict(RECORD.iter_unpack(data[HEADER.size:HEADER.size + count * RECORD.size]))
+                book = cls(size, entries, max_stones)
+            _books[path] = book
+        return _books[path]
+
+    def save(self, path=DEFAULT_BOOK):
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(BOOK_MAGIC, BOOK_VERSION, self.size, self.max_stones, len(self.entries)))
+            for key in sorted(self.entries):
+                f.write(RECORD.pack(key, self.entries[key]))
+        _books.pop(path, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, stones, move, keys):
+        key, index = canonical_key(stones, self.size, keys)
+        row, col = symmetries(self.size)[index](*move)
+        self.entries[key] = row * self.size + col
+        self.max_stones = max(self.max_stones, len(stones))
+
+    def lookup(self, logic):
+        """Book reply for the AI in logic's position, or None"""
+        if logic.size != self.size or not 0 < len(logic.move_history) <= self.max_stones:
+            return None
+        stones = [(row, col, int(logic.board[row][col])) for row, col in logic.move_history]
+        key, index = canonical_key(stones, self.size, logic.zobrist_keys)
+        cell = self.entries.get(key)
+        if cell is None:
+            return None
+        row, col = symmetries(self.size)[INVERSE[index]](*divmod(cell, self.size))
+        # A Zobrist collision could name an occupied cell
+        return (row, col) if logic.is_valid_move(row, col) else None
+
+
+def generate_book(size=10, depth=5, player_moves=2, log=print):
+    """Book of AI replies to every player move near the stones, for the first player_moves moves"""
+    from Logic import GomokuLogic
+    book = OpeningBook(size)
+    positions = [[]]  # Stones of the positions with the player to move
+    for ply in range(player_moves):
+        next_positions = []
+        start = time.time()
+        for stones in positions:
+            game = GomokuLogic(size=size, opening_book=None)
+            for row, col, player in stones:
+                game.make_move(row, col, player)
+            if stones:
+                replies = game.frontier_cells()
+            else:
+                replies = [(row, col) for row in range(size) for col in range(size)]
+            for reply in replies:
+                position = stones + [(reply[0], reply[1], 1)]
+                key, _ = canonical_key(position, size, game.zobrist_keys)
+                if key in book.entries:
+                    continue
+                search = GomokuLogic(size=size, opening_book=None)
+                for row, col, player in position:
+                    search.make_move(row, col, player)
+                move, _ = search._search_root(search.get_relevant_moves(), depth)
+                book.add(position, move, search.zobrist_keys)
+                next_positions.append(position + [(move[0], move[1], 2)])
+        log(f"player move {ply + 1}: {len(next_positions)} positions in {time.time() - start:.1f}s")
+        positions = next_positions
+    return book
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the Gomoku opening book by offline search")
+    parser.add_argument("--size", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=5, help="minimax depth for every book reply")
+    parser.add_argument("--player-moves", type=int, default=2, help="player moves the book covers")
+    parser.add_argument("--out", default=DEFAULT_BOOK)
+    args = parser.parse_args()
+    book = generate_book(args.size, args.depth, args.player_moves)
+    book.save(args.out)
+    print(f"Wrote {len(book)} positions to {args.out}")
@@ -0,0 +1,259 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from Patterns import (PATTERN_TABLES, CENTER, CENTER_SHIFT, WINDOW, WINDOW_MASK, BROKEN_THREE, FIVE,
+                      classify, classify_move)
+
+# Every row, column and diagonal is kept as an int with two bits per cell
+# (0 empty, 1 player, 2 AI, 3 off the board). A line is padded with PAD wall
+# cells on each side, so the code alone identifies the line's contents and
+# length and can key the score cache directly, and the 9-cell pattern window
+# around any cell is a plain shift and mask.
+WALL = 3
+PAD = 4
+
+# Per-stone, per-direction weights indexed by threat class (see Patterns.py)
+PATTERN_SCORES = [0, 10, 100, 1000, 1000, 10000, 100000, 1000000]
+# Bonus for having a move that completes five
+THREAT_SCORE = 500000
+
+_line_tables = {}
+_line_scores = {}
+_line_moves = {}
+_line_indices = {}
+
+
+def line_table(size):
+    """Per cell, the (line index, bit shift) of the four lines through it, and per line its empty code and cells"""
+    if size not in _line_tables:
+        cell_lines = [[[] for _ in range(size)] for _ in range(size)]
+        empty_codes = []
+        line_cells = []
+        for dr, dc in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+            for row in range(size):
+                for col in range(size):
+                    # Start a line only at cells with no predecessor on the board
+                    if 0 <= row - dr < size and 0 <= col - dc < size:
+                        continue
+                    length = 0
+                    cells = []
+                    r, c = row, col
+                    while 0 <= r < size and 0 <= c < size:
+                        cell_lines[r][c].append((len(empty_codes), 2 * (PAD + length)))
+                        cells.append((r, c))
+                        length += 1
+                        r, c = r + dr, c + dc
+                    code = 0
+                    for pos in list(range(PAD)) + list(range(PAD + length, 2 * PAD + length)):
+                        code |= WALL << (2 * pos)
+                    empty_codes.append(code)
+                    line_cells.append(cells)
+        _line_tables[size] = (cell_lines, empty_codes, line_cells)
+    return _line_tables[size]
+
+
+def score_line(code):
+    """Scores and flags of one line
+
+    (player score, AI score, player can complete five, AI can complete five,
+    player has a line_moves cell, AI has a line_moves cell)
+    """
+    if code in _line_scores:
+        return _line_scores[code]
+    scores = [0, 0, 0]
+    threats = [0, 0, 0]
+    moves = [0, 0, 0]
+    shift = 2 * PAD
+    while (code >> shift) & 3 != WALL:
+        cell = (code >> shift) & 3
+        window = (code >> (shift - CENTER_SHIFT)) & WINDOW_MASK
+        if cell:
+            scores[cell] += PATTERN_SCORES[classify(window, cell)]
+        else:
+            for player in (1, 2):
+                pattern = classify_move(window, player)
+                if pattern == FIVE:
+                    threats[player] = 1
+                if pattern >= BROKEN_THREE:
+                    moves[player] = 1
+        shift += 2
+    result = (scores[1], scores[2], threats[1], threats[2], moves[1], moves[2])
+    _line_scores[code] = result
+    return result
+
+
+def line_moves(code, player):
+    """(position, class) of the empty cells where player's stone makes at least a broken three on one line"""
+    key = (code, player)
+    if key in _line_moves:
+        return _line_moves[key]
+    moves = []
+    position = 0
+    shift = 2 * PAD
+    while (code >> shift) & 3 != WALL:
+        if not (code >> shift) & 3:
+            pattern = classify_move((code >> (shift - CENTER_SHIFT)) & WINDOW_MASK, player)
+            if pattern >= BROKEN_THREE:
+                moves.append((position, pattern))
+        position += 1
+        shift += 2
+    result = tuple(moves)
+    _line_moves[key] = result
+    return result
+
+
+class IncrementalEvaluator:
+    def __init__(self, size):
+        self.cell_lines, empty_codes, self.line_cells = line_table(size)
+        self.codes = list(empty_codes)
+        self.line_scores = [score_line(code) for code in self.codes]
+        # Running totals over all lines, indexed by player
+        self.scores = [0, 0, 0]
+        self.threats = [0, 0, 0]
+        # Per player, the lines with a cell where a stone makes at least a broken three,
+        # and the lines with a cell that completes five, so scans skip the quiet lines
+        self.move_lines = [None, set(), set()]
+        self.five_lines = [None, set(), set()]
+
+    def place(self, row, col, player):
+        self._update(row, col, player)
+
+    def remove(self, row, col, player):
+        self._update(row, col, -player)
+
+    def _update(self, row, col, delta):
+        """Rescore only the four lines through (row, col)"""
+        codes = self.codes
+        line_scores = self.line_scores
+        scores = self.scores
+        threats = self.threats
+        for line, shift in self.cell_lines[row][col]:
+            old = line_scores[line]
+            codes[line] += delta << shift
+            new = line_scores[line] = _line_scores.get(codes[line]) or score_line(codes[line])
+            scores[1] += new[0] - old[0]
+            scores[2] += new[1] - old[1]
+            threats[1] += new[2] - old[2]
+            threats[2] += new[3] - old[3]
+            if new[2:] != old[2:]:
+                for player in (1, 2):
+                    if new[player + 3]:
+                        self.move_lines[player].add(line)
+                    else:
+                        self.move_lines[player].discard(line)
+                    if new[player + 1]:
+                        self.five_lines[player].add(line)
+                    else:
+                        self.five_lines[player].discard(line)
+
+    def evaluate(self):
+        """AI score minus player score, as GomokuLogic.evaluate_board defines it"""
+        ai_score = self.scores[2] + (THREAT_SCORE if self.threats[2] else 0)
+        player_score = self.scores[1] + (THREAT_SCORE if self.threats[1] else 0)
+        return ai_score - player_score
+
+    def threat_moves(self, player, min_class):
+        """{(row, col): strongest class} of empty cells where player's stone reaches min_class on some line"""
+        moves = {}
+        for line in sorted(self.move_lines[player]):
+            for position, pattern in line_moves(self.codes[line], player):
+                if pattern >= min_class:
+                    cell = self.line_cells[line][position]
+                    if moves.get(cell, 0) < pattern:
+                        moves[cell] = pattern
+        return moves
+
+    def winning_cells(self, player):
+        """Empty cells that complete five for player, in line order"""
+        cells = []
+        # Only lines flagged by score_line can hold one
+        for line in sorted(self.five_lines[player]):
+            for position, pattern in line_moves(self.codes[line], player):
+                cell = self.line_cells[line][position]
+                if pattern == FIVE and cell not in cells:
+                    cells.append(cell)
+        return cells
+
+
+def line_indices(size):
+    """Flat indices into a board padded with PAD walls, one row per line through the board"""
+    if size not in _line_indices:
+        width = size + 2 * PAD
+        length = size + 2 * PAD
+        lines = []
+        for dr, dc in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+            for row in range(size):
+                for col in range(size):
+                    if 0 <= row - dr < size and 0 <= col - dc < size:
+                        continue
+                    # Walk from PAD cells before the line's first cell; short lines are
+                    # filled up with index 0, a corner wall cell
+                    r, c = row - PAD * dr, col - PAD * dc
+                    cells = []
+                    while len(cells) < length and -PAD <= r < size + PAD and -PAD <= c < size + PAD:
+                        cells.append((r + PAD) * width + c + PAD)
+                        r, c = r + dr, c + dc
+                    lines.append(cells + [0] * (length - len(cells)))
+        _line_indices[size] = np.array(lines)
+    return _line_indices[size]
+
+
+def board_windows(boards):
+    """Pattern window code and centre cell of every cell of every line of a (count, size, size) stack
+
+    Both are (count, lines, cells per line) arrays; centres off the board are WALL.
+    """
+    count, size = boards.shape[0], boards.shape[1]
+    padded = np.full((count, size + 2 * PAD, size + 2 * PAD), WALL, dtype=np.int64)
+    padded[:, PAD:PAD + size, PAD:PAD + size] = boards
+    lines = padded.reshape(count, -1)[:, line_indices(size)]
+    # Window codes for every cell of every line, in the layout the pattern tables use
+    windows = sliding_window_view(lines, WINDOW, axis=-1)
+    return windows @ (4 ** np.arange(WINDOW)), windows[..., CENTER]
+
+
+_window_tables = None
+
+
+def window_tables():
+    """Per window code, the AI's minus the player's score for the centre stone, and threat flags
+
+    A flag bit (1 for the player, 2 for the AI) is set where the centre is
+    empty and a stone there completes five. One lookup in each table does
+    the per-window work of evaluate_windows.
+    """
+    global _window_tables
+    if _window_tables is None:
+        codes = np.arange(4 ** WINDOW)
+        centers = (codes >> CENTER_SHIFT) & 3
+        scores = np.asarray(PATTERN_SCORES)
+        net = np.zeros(len(codes), dtype=np.int64)
+        flags = np.zeros(len(codes), dtype=np.uint8)
+        for player, sign in ((1, -1), (2, 1)):
+            table = np.frombuffer(PATTERN_TABLES[player], dtype=np.uint8)
+            net += np.where(centers == player, sign * scores[table], 0)
+            moves = table[(codes & ~(3 << CENTER_SHIFT)) | (player << CENTER_SHIFT)]
+            flags |= np.where((centers == 0) & (moves == FIVE), player, 0).astype(np.uint8)
+        _window_tables = (net, flags)
+    return _window_tables
+
+
+def evaluate_windows(codes):
+    """evaluate_boards of the stack board_windows gave codes for"""
+    net, flags = window_tables()
+    result = net[codes].sum(axis=(1, 2))
+    threats = np.bitwise_or.reduce(flags[codes], axis=(1, 2))
+    # A threat is an empty cell that completes five for that side
+    result += THREAT_SCORE * ((threats & 2) > 0)
+    result -= THREAT_SCORE * ((threats & 1) > 0)
+    return result
+
+
+def evaluate_boards(boards):
+    """evaluate_board for one (size, size) board or a (count, size, size) stack, vectorised over all lines"""
+    boards = np.asarray(boards)
+    single = boards.ndim == 2
+    if single:
+        boards = boards[None]
+    codes, _ = board_windows(boards)
+    result = evaluate_windows(codes)
+    return int(result[0]) if single else result
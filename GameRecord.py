@@ -0,0 +1,130 @@
+import mmap
+import os
+import struct
+import time
+
+# A record file is a plain concatenation of games, so writers only ever append.
+# Each game is a fixed header followed by one byte per move, row * size + col,
+# the players alternating from player 1.
+MAGIC = b"GK"
+VERSION = 1
+# magic, version, board size, mode, result, moves, start (Unix seconds),
+# duration and AI thinking time (milliseconds)
+HEADER = struct.Struct("<2sBBBBHIII")
+# One byte per move holds every cell of a board up to this size
+MAX_SIZE = 16
+MODES = ("Player VS AI", "Player VS Player")
+# Results besides the winning player's number
+UNFINISHED = 0
+DRAW = 3
+
+
+class GameRecord:
+    """One stored game; moves are decoded from the bytes only when asked for"""
+
+    __slots__ = ("size", "mode", "result", "started", "duration", "ai_time", "data")
+
+    def __init__(self, size, mode, result, started, duration, ai_time, data):
+        self.size = size
+        self.mode = mode
+        self.result = result  # 1 or 2 for the winner, DRAW, or UNFINISHED
+        self.started = started  # Unix time the game began
+        self.duration = duration  # Seconds from the start of the game to its end
+        self.ai_time = ai_time  # Seconds the AI spent searching
+        self.data = data  # One byte per move
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def moves(self):
+        """(row, col) of every move in order"""
+        return [divmod(cell, self.size) for cell in self.data]
+
+    def players(self):
+        """((row, col), player) of every move in order"""
+        return [(move, 1 if i % 2 == 0 else 2) for i, move in enumerate(self.moves)]
+
+
+def read_games(path):
+    """Yield every game in a record file, reading it through a memory map
+
+    Only one game is decoded at a time, so files of any length stream in
+    constant memory. A game cut short by a crash mid-write ends the file.
+    """
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        offset = 0
+        end = len(data)
+        while offset + HEADER.size <= end:
+            magic, version, size, mode, result, moves, started, duration, ai_time = HEADER.unpack_from(data, offset)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"No game record at byte {offset} of {path}")
+            offset += HEADER.size
+            if offset + moves > end:
+                return
+            yield GameRecord(size, MODES[mode], result, started, duration / 1000, ai_time / 1000,
+                             data[offset:offset + moves])
+            offset += moves
+
+
+class GameWriter:
+    """Streams games into a record file as they are played
+
+    GomokuLogic.make_move reports every move of a game whose recorder is
+    this writer; undo() takes the last one back. finish() appends the game
+    with its result, and start() or close() first append a game left
+    unfinished. A game resumed by undo after finish() is appended again
+    when it ends, as a game of its own.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "ab")
+        self.size = None
+        self.mode = 0
+        self.moves = bytearray()
+        self.started = 0.0
+        self.ai_seconds = 0.0
+        self.saved = True
+
+    def start(self, size, mode):
+        if size > MAX_SIZE:
+            raise ValueError(f"Records hold boards up to {MAX_SIZE}x{MAX_SIZE}, not {size}x{size}")
+        self.finish(UNFINISHED)
+        self.size = size
+        self.mode = MODES.index(mode)
+        self.moves = bytearray()
+        self.started = time.time()
+        self.ai_seconds = 0.0
+        self.saved = True
+
+    def move(self, row, col):
+        self.moves.append(row * self.size + col)
+        self.saved = False
+
+    def undo(self):
+        if self.moves:
+            self.moves.pop()
+            self.saved = False
+
+    def ai_time(self, seconds):
+        """Add the search time of an AI move to the game's total"""
+        self.ai_seconds += seconds
+
+    def finish(self, result):
+        """Append the game so far with result, unless it is empty or already appended"""
+        if self.saved or not self.moves or self.file is None:
+            return
+        header = HEADER.pack(MAGIC, VERSION, self.size, self.mode, result, len(self.moves), int(self.started),
+                             int((time.time() - self.started) * 1000), int(self.ai_seconds * 1000))
+        # One write per game, flushed, so a crash loses at most the game in progress
+        self.file.write(header + self.moves)
+        self.file.flush()
+        self.saved = True
+
+    def close(self):
+        if self.file is not None:
+            self.finish(UNFINISHED)
+            self.file.close()
+            self.file = None
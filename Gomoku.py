@@ -3,6 +3,9 @@ import platform
 from UI import GomokuGame
 
 FPS = 60
+# When nothing is happening on screen, the desktop build blocks this long for
+# the next event instead of polling; the browser build must keep yielding
+IDLE_WAIT_MS = 0 if platform.system() == "Emscripten" else 250
 
 def setup():
     global game
@@ -11,7 +14,7 @@ def setup():
 async def main():
     setup()
     while True:
-        game.update_loop()
+        game.update_loop(IDLE_WAIT_MS)
         await asyncio.sleep(1.0 / FPS)
 
 if platform.system() == "Emscripten":
@@ -1,7 +1,80 @@
+import random
+import time
 import numpy as np
+from Evaluator import IncrementalEvaluator, PATTERN_SCORES, evaluate_boards
+from Transposition import TranspositionTable, EXACT, LOWER, UPPER
+from Threats import ThreatSolver, WIN_SCORE
+from Parallel import RootSplitter
+from Book import OpeningBook, DEFAULT_BOOK
+from MCTS import MCTS, ROLLOUTS
+from Stats import SearchStats
+from Patterns import (PATTERN_TABLES, CENTER_SHIFT, WINDOW_MASK, FIVE, OPEN_FOUR,
+                      OPEN_THREE, BROKEN_THREE)
+
+# Fixed seed so Zobrist keys are identical across runs and processes
+ZOBRIST_SEED = 0x5EED
+# XORed into transposition keys when the AI (maximizing player) is to move
+ZOBRIST_SIDE = random.Random(ZOBRIST_SEED).getrandbits(64)
+_zobrist_tables = {}
+
+def zobrist_table(size):
+    """Random 64-bit keys indexed by [player][row][col], shared per board size"""
+    if size not in _zobrist_tables:
+        rng = random.Random(ZOBRIST_SEED + size)
+        _zobrist_tables[size] = [[[rng.getrandbits(64) if player else 0 for _ in range(size)]
+                                  for _ in range(size)] for player in range(3)]
+    return _zobrist_tables[size]
+
+CENTER_BITS = 3 << CENTER_SHIFT
+
+# Move generation considers the empty cells within this many rows and columns of a stone
+NEAR_RADIUS = 2
+_neighbourhood_tables = {}
+
+def neighbourhood_table(size):
+    """Per cell, ((row, col), row * size + col) of the other cells within NEAR_RADIUS of it, shared per board size"""
+    if size not in _neighbourhood_tables:
+        _neighbourhood_tables[size] = [[[((r, c), r * size + c)
+                                         for r in range(max(0, row - NEAR_RADIUS), min(size, row + NEAR_RADIUS + 1))
+                                         for c in range(max(0, col - NEAR_RADIUS), min(size, col + NEAR_RADIUS + 1))
+                                         if (r, c) != (row, col)]
+                                        for col in range(size)] for row in range(size)]
+    return _neighbourhood_tables[size]
+
+# quick_evaluate_move weights per threat class (see Patterns.py) for attack and defence
+QUICK_AI_SCORES = [0, 50, 100, 500, 500, 1000, 10000, 100000]
+QUICK_PLAYER_SCORES = [0, 45, 90, 450, 450, 900, 9000, 90000]
+
+# Entries pattern_cache may hold before find_best_move starts it afresh; its
+# keys include the Zobrist key, so entries stay valid from move to move
+PATTERN_CACHE_ENTRIES = 200000
+
+# VCF inside minimax: attacker moves and nodes allowed per search node
+SEARCH_VCF_DEPTH = 6
+SEARCH_VCF_NODES = 200
+
+# Half-width of the PVS root window around the previous iteration's score
+ASPIRATION_WINDOW = 10000
+
+# Fraction of find_best_move's time limit the VCF/VCT search may use before minimax starts
+THREAT_TIME_SHARE = 0.5
+
+# ponder() gives up after this long, so an idle game stops using the CPU
+PONDER_LIMIT_MS = 10000
+
+class SearchTimeout(Exception):
+    """Raised inside minimax when the time budget of find_best_move runs out or the search is stopped"""
 
 class GomokuLogic:
-    def __init__(self, size=10, game_mode="Player VS AI"):
+    def __init__(self, size=10, game_mode="Player VS AI", tt_entries=None, tt_megabytes=None,
+                 move_ordering="heuristic", workers=1, opening_book=DEFAULT_BOOK, search="minimax",
+                 rollouts=ROLLOUTS):
+        if move_ordering not in ("heuristic", "static"):
+            raise ValueError(f"Unknown move ordering: {move_ordering}")
+        if workers < 1:
+            raise ValueError(f"Need at least one worker, got {workers}")
+        if search not in ("minimax", "pvs", "mcts"):
+            raise ValueError(f"Unknown search: {search}")
         self.size = size
         self.board = np.zeros((size, size), dtype=int)  # 0: empty, 1: player, 2: AI
         self.current_player = 1
@@ -13,22 +86,113 @@ class GomokuLogic:
         self.pattern_cache = {}
         # Store move history for faster relevant move generation
         self.move_history = []
-        # Transposition table for minimax
-        self.transposition_table = {}
+        # One entry per push() with the state pop() restores
+        self.undo_stack = []
+        # Transposition table for minimax, bounded and kept for the whole game
+        self.transposition_table = TranspositionTable(tt_entries, tt_megabytes)
+        # perf_counter() deadline of a time-limited search, None when unlimited
+        self.deadline = None
+        # Set from another thread to abort a running search with SearchTimeout
+        self.stop_search = False
+        self.nodes = 0  # minimax calls (MCTS playouts) made by the last find_best_move
+        # Per-search counters while enabled with enable_stats, otherwise None
+        self.stats = None
+        # Move ordering inside minimax: "static" uses only get_relevant_moves' order,
+        # "heuristic" tries the TT move, killer moves and history scores first
+        self.move_ordering = move_ordering
+        # "minimax" is the min/max alpha-beta search; "pvs" is negamax with null-window
+        # searches after the first move and aspiration windows between iterations; "mcts"
+        # replaces both with Monte Carlo tree search, rollouts playouts per move without a time limit
+        self.search = search
+        self.completed_depth = 0  # Deepest minimax/PVS iteration the last find_best_move finished
+        self.search_score = None  # Score of that iteration's move for the AI
+        # That iteration's principal variation: the AI's move, the player's expected reply, ...
+        self.principal_variation = []
+        # (Zobrist key, deepest finished iteration, score, principal variation) of the position the
+        # next search is expected to start from: after the expected reply, or after ponder()'s move
+        self.continuation = None
+        # Iterations the last time-limited find_best_move skipped by carrying on from the continuation;
+        # a fixed-depth search only takes its first move and score and always reports 0
+        self.reused_depth = 0
+        self.killers = []  # Per ply, the last two moves that caused a cutoff
+        self.history = [[[0] * size for _ in range(size)] for _ in range(3)]  # [player][row][col]
         self.game_mode = game_mode  # Added for compatibility with UI.py
+        # GameRecord.GameWriter told about every make_move, or None; searches use push/pop and are never recorded
+        self.recorder = None
         # Track the winning sequence
         self.winning_sequence = []
+        # Zobrist hashing: the key is XOR-updated on every placement and removal
+        self.zobrist_keys = zobrist_table(size)
+        self.zobrist_hash = 0
+        # Candidate frontier: per cell (row * size + col) the number of stones within
+        # NEAR_RADIUS, and the set of empty cells where it is above zero. Both follow
+        # every placement and removal, searched stones included. Readers go through
+        # frontier_cells() so the order depends only on the position.
+        self.neighbourhood = neighbourhood_table(size)
+        self.near_counts = [0] * (size * size)
+        self.frontier = set()
+        # Running per-line scores, updated on every placement and removal
+        self.evaluator = IncrementalEvaluator(size)
+        # Forced wins by continuous fours and threes, tried before and inside minimax
+        self.threat_solver = ThreatSolver(self)
+        # With several workers the root moves are searched in a process pool
+        self.root_splitter = RootSplitter(workers) if workers > 1 else None
+        # Kept from move to move so the tree of the position reached is reused
+        self.mcts = MCTS(self, rollouts) if search == "mcts" else None
+        # Precomputed replies for early positions; opening_book is a file path or None
+        self.opening_book = OpeningBook.load(opening_book) if opening_book else None
 
     def is_valid_move(self, row, col):
         return 0 <= row < self.size and 0 <= col < self.size and self.board[row][col] == 0
 
+    def _place(self, row, col, player):
+        """Put a stone on the board and update the Zobrist key"""
+        self.board[row][col] = player
+        self.zobrist_hash ^= self.zobrist_keys[player][row][col]
+        self.evaluator.place(row, col, player)
+        frontier = self.frontier
+        frontier.discard((row, col))
+        counts = self.near_counts
+        for cell, index in self.neighbourhood[row][col]:
+            counts[index] += 1
+            if counts[index] == 1 and not self.board[cell]:
+                frontier.add(cell)
+
+    def _remove(self, row, col, player):
+        """Take a stone placed by _place off the board again"""
+        self.board[row][col] = 0
+        self.zobrist_hash ^= self.zobrist_keys[player][row][col]
+        self.evaluator.remove(row, col, player)
+        frontier = self.frontier
+        counts = self.near_counts
+        for cell, index in self.neighbourhood[row][col]:
+            counts[index] -= 1
+            if not counts[index]:
+                frontier.discard(cell)
+        if counts[row * self.size + col]:
+            frontier.add((row, col))
+
+    def push(self, move, player):
+        """Play player's stone at move, unchecked; pop() takes it back"""
+        self.undo_stack.append((move, player, self.last_move, self.current_player, self.game_over, self.winner,
+                                self.winning_sequence))
+        self._place(move[0], move[1], player)
+        self.last_move = move
+        self.move_history.append(move)
+
+    def pop(self):
+        """Undo the last push, restoring the state before it; returns (move, player)"""
+        (move, player, self.last_move, self.current_player, self.game_over, self.winner,
+         self.winning_sequence) = self.undo_stack.pop()
+        self.move_history.pop()
+        self._remove(move[0], move[1], player)
+        return move, player
+
     def make_move(self, row, col, player):
         if self.is_valid_move(row, col):
-            self.board[row][col] = player
-            self.last_move = (row, col)
-            self.move_history.append((row, col))
-            # Clear the pattern cache when a move is made
-            self.pattern_cache = {}
+            self.push((row, col), player)
+            if self.recorder:
+                self.recorder.move(row, col)
             return True
         return False
 
@@ -44,7 +208,7 @@ class GomokuLogic:
             return False
         
         # Check if this position was already evaluated
-        cache_key = (row, col, player)
+        cache_key = ('winner', self.zobrist_hash, row, col, player)
         if cache_key in self.pattern_cache:
             result = self.pattern_cache[cache_key].get('winner', False)
             if result:
@@ -83,176 +247,75 @@ class GomokuLogic:
     def is_board_full(self):
         return len(self.move_history) >= self.size * self.size
 
-    def _count_stones_in_direction(self, row, col, player, dr, dc, max_count=5):
-        """Helper function to count consecutive stones in a direction"""
-        count = 0
-        empty_spots = []
-        for k in range(1, max_count):
-            r, c = row + dr * k, col + dc * k
-            if 0 <= r < self.size and 0 <= c < self.size:
-                if self.board[r][c] == player:
-                    count += 1
-                elif self.board[r][c] == 0:
-                    empty_spots.append((r, c))
-                    break
-                else:
-                    break
-            else:
-                break
-        return count, empty_spots
+    def _pattern_classes(self, row, col, player):
+        """Threat class along each direction with a player stone at (row, col), placed or not"""
+        codes = self.evaluator.codes
+        table = PATTERN_TABLES[player]
+        stone = player << CENTER_SHIFT
+        classes = []
+        for line, shift in self.evaluator.cell_lines[row][col]:
+            window = (codes[line] >> (shift - CENTER_SHIFT)) & WINDOW_MASK
+            classes.append(table[(window & ~CENTER_BITS) | stone])
+        return classes
+
+    def frontier_cells(self):
+        """Empty cells within NEAR_RADIUS of a stone, in row-major order"""
+        return sorted(self.frontier)
 
     def check_immediate_threat(self, player):
         """Find winning move for a player"""
         # Cache key for this evaluation
-        cache_key = ('threat', player, hash(self.board.tobytes()))
+        cache_key = ('threat', player, self.zobrist_hash)
         if cache_key in self.pattern_cache:
             return self.pattern_cache[cache_key]
         
-        # Only check empty spots near existing stones (within 2 cells)
-        checked_positions = set()
-        for r, c in self.move_history:
-            for dr in range(-2, 3):
-                for dc in range(-2, 3):
-                    check_r, check_c = r + dr, c + dc
-                    if (0 <= check_r < self.size and 0 <= check_c < self.size and 
-                        self.board[check_r][check_c] == 0 and 
-                        (check_r, check_c) not in checked_positions):
-                        
-                        checked_positions.add((check_r, check_c))
-                        self.board[check_r][check_c] = player
-                        if self.check_winner(player, last_move=(check_r, check_c)):
-                            self.board[check_r][check_c] = 0
-                            self.pattern_cache[cache_key] = (check_r, check_c)
-                            return (check_r, check_c)
-                        self.board[check_r][check_c] = 0
+        move = None
+        # Only check empty spots near existing stones (the frontier)
+        for check_r, check_c in self.frontier_cells():
+            if FIVE in self._pattern_classes(check_r, check_c, player):
+                move = (check_r, check_c)
+                break
         
-        self.pattern_cache[cache_key] = None
-        return None
+        self.pattern_cache[cache_key] = move
+        return move
 
     def find_open_four_move(self, player):
         """Find a move that creates an open four (leads to guaranteed win)"""
-        cache_key = ('open_four', player, hash(self.board.tobytes()))
+        cache_key = ('open_four', player, self.zobrist_hash)
         if cache_key in self.pattern_cache:
             return self.pattern_cache[cache_key]
         
+        move = None
         # Check each empty position near existing stones
-        checked_positions = set()
-        for r, c in self.move_history:
-            for dr in range(-2, 3):
-                for dc in range(-2, 3):
-                    check_r, check_c = r + dr, c + dc
-                    if (0 <= check_r < self.size and 0 <= check_c < self.size and 
-                        self.board[check_r][check_c] == 0 and 
-                        (check_r, check_c) not in checked_positions):
-                        
-                        checked_positions.add((check_r, check_c))
-                        self.board[check_r][check_c] = player
-                        
-                        # Check if this move creates an open four
-                        has_open_four = False
-                        for direction in self.directions:
-                            dr, dc = direction
-                            # Check for patterns like: O X X X X O (where O are empty spaces)
-                            consecutive = 1  # Start with 1 for the current stone
-                            blocked_ends = 0
-                            
-                            # Count one direction
-                            for k in range(1, 5):
-                                r, c = check_r + dr * k, check_c + dc * k
-                                if 0 <= r < self.size and 0 <= c < self.size:
-                                    if self.board[r][c] == player:
-                                        consecutive += 1
-                                    elif self.board[r][c] == 0:
-                                        break
-                                    else:  # Opponent stone
-                                        blocked_ends += 1
-                                        break
-                                else:
-                                    blocked_ends += 1
-                                    break
-                            
-                            # Count opposite direction
-                            for k in range(1, 5):
-                                r, c = check_r - dr * k, check_c - dc * k
-                                if 0 <= r < self.size and 0 <= c < self.size:
-                                    if self.board[r][c] == player:
-                                        consecutive += 1
-                                    elif self.board[r][c] == 0:
-                                        break
-                                    else:  # Opponent stone
-                                        blocked_ends += 1
-                                        break
-                                else:
-                                    blocked_ends += 1
-                                    break
-                            
-                            # Check for open four (4 consecutive with no blocked ends)
-                            if consecutive >= 4 and blocked_ends == 0:
-                                has_open_four = True
-                                break
-                        
-                        self.board[check_r][check_c] = 0
-                        if has_open_four:
-                            self.pattern_cache[cache_key] = (check_r, check_c)
-                            return (check_r, check_c)
+        for check_r, check_c in self.frontier_cells():
+            if OPEN_FOUR in self._pattern_classes(check_r, check_c, player):
+                move = (check_r, check_c)
+                break
         
-        self.pattern_cache[cache_key] = None
-        return None
+        self.pattern_cache[cache_key] = move
+        return move
 
     def check_open_three(self, player):
-        """Find positions where player has an open three"""
-        cache_key = ('has_open_three', player, hash(self.board.tobytes()))
+        """Find the empty cells that would turn one of player's open threes into an open four"""
+        cache_key = ('has_open_three', player, self.zobrist_hash)
         if cache_key in self.pattern_cache:
             return self.pattern_cache[cache_key]
         
         open_three_positions = []
-        
-        # Check positions near existing stones
         for r, c in self.move_history:
             if self.board[r][c] != player:
                 continue
-                
-            for dr, dc in self.directions:
-                # Check for patterns with 3 consecutive stones with open ends
-                count = 1  # Start with 1 for the current stone
-                blocked_ends = 0
-                empty_spots = []
-                
-                # Forward direction
-                for k in range(1, 4):
+            for d, pattern in enumerate(self._pattern_classes(r, c, player)):
+                if pattern != OPEN_THREE and pattern != BROKEN_THREE:
+                    continue
+                # Split threes are only completed through the gap, so look at every cell of the window
+                dr, dc = self.directions[d]
+                for k in range(-4, 5):
                     check_r, check_c = r + dr * k, c + dc * k
-                    if 0 <= check_r < self.size and 0 <= check_c < self.size:
-                        if self.board[check_r][check_c] == player:
-                            count += 1
-                        elif self.board[check_r][check_c] == 0:
-                            empty_spots.append((check_r, check_c))
-                            break
-                        else:  # Opponent stone
-                            blocked_ends += 1
-                            break
-                    else:
-                        blocked_ends += 1
-                        break
-                
-                # Backward direction
-                for k in range(1, 4):
-                    check_r, check_c = r - dr * k, c - dc * k
-                    if 0 <= check_r < self.size and 0 <= check_c < self.size:
-                        if self.board[check_r][check_c] == player:
-                            count += 1
-                        elif self.board[check_r][check_c] == 0:
-                            empty_spots.append((check_r, check_c))
-                            break
-                        else:  # Opponent stone
-                            blocked_ends += 1
-                            break
-                    else:
-                        blocked_ends += 1
-                        break
-                
-                # If we found an open three (3 consecutive with no blocked ends)
-                if count == 3 and blocked_ends == 0 and empty_spots:
-                    open_three_positions.extend(empty_spots)
+                    if (self.is_valid_move(check_r, check_c) and
+                        (check_r, check_c) not in open_three_positions and
+                        self._pattern_classes(check_r, check_c, player)[d] == OPEN_FOUR):
+                        open_three_positions.append((check_r, check_c))
         
         self.pattern_cache[cache_key] = open_three_positions
         return open_three_positions
@@ -270,284 +333,431 @@ class GomokuLogic:
         """Evaluate the value of a single position for the given player"""
         if self.board[row][col] != player:
             return 0
-            
-        score = 0
-        for dr, dc in self.directions:
-            consecutive = 1
-            blocked_ends = 0
-            
-            # Forward direction
-            for k in range(1, 5):
-                r, c = row + dr * k, col + dc * k
-                if 0 <= r < self.size and 0 <= c < self.size:
-                    if self.board[r][c] == player:
-                        consecutive += 1
-                    elif self.board[r][c] == 0:
-                        break
-                    else:  # Opponent stone
-                        blocked_ends += 1
-                        break
-                else:
-                    blocked_ends += 1
-                    break
-            
-            # Backward direction
-            for k in range(1, 5):
-                r, c = row - dr * k, col - dc * k
-                if 0 <= r < self.size and 0 <= c < self.size:
-                    if self.board[r][c] == player:
-                        consecutive += 1
-                    elif self.board[r][c] == 0:
-                        break
-                    else:  # Opponent stone
-                        blocked_ends += 1
-                        break
-                else:
-                    blocked_ends += 1
-                    break
-            
-            # Score based on pattern
-            if consecutive >= 5:
-                score += 1000000  # Win
-            elif consecutive == 4 and blocked_ends == 0:
-                score += 100000   # Open four
-            elif consecutive == 4 and blocked_ends == 1:
-                score += 10000    # Closed four
-            elif consecutive == 3 and blocked_ends == 0:
-                score += 1000     # Open three
-            elif consecutive == 3 and blocked_ends == 1:
-                score += 100      # Closed three
-            elif consecutive == 2 and blocked_ends == 0:
-                score += 10       # Open two
-        
-        return score
+        return sum(PATTERN_SCORES[pattern] for pattern in self._pattern_classes(row, col, player))
 
     def evaluate_board(self):
         """Evaluate the entire board state"""
-        cache_key = ('evaluate', hash(self.board.tobytes()))
-        if cache_key in self.pattern_cache:
-            return self.pattern_cache[cache_key]
-            
-        ai_score = 0
-        player_score = 0
-        
-        # Only evaluate positions with stones
-        for r, c in self.move_history:
-            if self.board[r][c] == 1:
-                player_score += self.evaluate_position(r, c, 1)
-            elif self.board[r][c] == 2:
-                ai_score += self.evaluate_position(r, c, 2)
-        
-        # Check for immediate threats
-        if self.check_immediate_threat(1):
-            player_score += 500000
-        if self.check_immediate_threat(2):
-            ai_score += 500000
-            
-        result = ai_score - player_score
-        self.pattern_cache[cache_key] = result
-        return result
+        # Line scores are kept up to date by _place/_remove, so this is O(1)
+        return self.evaluator.evaluate()
+
+    def evaluate_board_vectorized(self):
+        """Evaluate the board from scratch with NumPy; same result as evaluate_board"""
+        return evaluate_boards(self.board)
+
+    def evaluate_moves(self, moves, player):
+        """Static evaluation of the board after each of moves, scored together in one batch"""
+        if not moves:
+            return []
+        boards = np.repeat(self.board[None], len(moves), axis=0)
+        rows, cols = zip(*moves)
+        boards[np.arange(len(moves)), rows, cols] = player
+        return evaluate_boards(boards).tolist()
 
     def get_relevant_moves(self):
         """Get empty positions that are relevant for the current game state"""
+        return [move for move, _ in self._scored_relevant_moves()]
+
+    def _scored_relevant_moves(self):
+        """get_relevant_moves with each move's quick_evaluate_move score"""
         if not self.move_history:
-            return [(self.size // 2, self.size // 2)]  # First move in center
+            return [((self.size // 2, self.size // 2), 0)]  # First move in center
             
-        # Look for empty spots near existing stones
-        potential_moves = set()
-        radius = 2  # Consider spots within 2 cells of any existing stone
-        
-        for r, c in self.move_history:
-            for dr in range(-radius, radius + 1):
-                for dc in range(-radius, radius + 1):
-                    check_r, check_c = r + dr, c + dc
-                    if (0 <= check_r < self.size and 0 <= check_c < self.size and 
-                        self.board[check_r][check_c] == 0):
-                        potential_moves.add((check_r, check_c))
-        
+        # Empty spots within NEAR_RADIUS of a stone, kept up to date by _place/_remove
         # Sort moves by a quick heuristic evaluation
         moves_with_score = []
-        for move in potential_moves:
+        for move in self.frontier_cells():
             row, col = move
-            # Try the move for AI
-            self.board[row][col] = 2
             score = self.quick_evaluate_move(row, col)
-            self.board[row][col] = 0
             moves_with_score.append((move, score))
         
         # Sort by score in descending order
         moves_with_score.sort(key=lambda x: x[1], reverse=True)
         
         # Return the top 12 moves at most (or all if fewer)
-        return [move for move, _ in moves_with_score[:12]]
+        return moves_with_score[:12]
 
     def quick_evaluate_move(self, row, col):
-        """Quick heuristic evaluation of a position"""
-        score = 0
-        
-        # Check for winning move
-        if self.check_winner(2, (row, col)):
+        """Quick heuristic evaluation of an empty position"""
+        # Attacking value of an AI stone here
+        ai_patterns = self._pattern_classes(row, col, 2)
+        if FIVE in ai_patterns:
             return 1000000
-            
-        # Check patterns in all directions
-        for dr, dc in self.directions:
-            # Count AI stones (player 2)
-            ai_count = 1  # Start with 1 for the current position
-            ai_blocked = 0
-            
-            # Forward
-            for k in range(1, 5):
-                r, c = row + dr * k, col + dc * k
-                if 0 <= r < self.size and 0 <= c < self.size:
-                    if self.board[r][c] == 2:
-                        ai_count += 1
-                    elif self.board[r][c] == 1:  # Blocked by player
-                        ai_blocked += 1
-                        break
-                    else:
-                        break
-                else:
-                    ai_blocked += 1
-                    break
-                    
-            # Backward
-            for k in range(1, 5):
-                r, c = row - dr * k, col - dc * k
-                if 0 <= r < self.size and 0 <= c < self.size:
-                    if self.board[r][c] == 2:
-                        ai_count += 1
-                    elif self.board[r][c] == 1:  # Blocked by player
-                        ai_blocked += 1
-                        break
-                    else:
-                        break
-                else:
-                    ai_blocked += 1
-                    break
-            
-            # Score AI patterns
-            if ai_count >= 5:
-                score += 100000
-            elif ai_count == 4 and ai_blocked == 0:
-                score += 10000
-            elif ai_count == 4 and ai_blocked == 1:
-                score += 1000
-            elif ai_count == 3 and ai_blocked == 0:
-                score += 500
-            elif ai_count == 3 and ai_blocked == 1:
-                score += 100
-            elif ai_count == 2 and ai_blocked == 0:
-                score += 50
-            
-            # Now look for defensive moves (blocking player patterns)
-            # Reset for player stones (player 1)
-            self.board[row][col] = 1  # Temporarily switch to check player patterns
-            player_count = 1
-            player_blocked = 0
-            
-            # Forward
-            for k in range(1, 5):
-                r, c = row + dr * k, col + dc * k
-                if 0 <= r < self.size and 0 <= c < self.size:
-                    if self.board[r][c] == 1:
-                        player_count += 1
-                    elif self.board[r][c] == 2:  # Blocked by AI
-                        player_blocked += 1
-                        break
-                    else:
-                        break
-                else:
-                    player_blocked += 1
-                    break
-                    
-            # Backward
-            for k in range(1, 5):
-                r, c = row - dr * k, col - dc * k
-                if 0 <= r < self.size and 0 <= c < self.size:
-                    if self.board[r][c] == 1:
-                        player_count += 1
-                    elif self.board[r][c] == 2:  # Blocked by AI
-                        player_blocked += 1
-                        break
-                    else:
-                        break
-                else:
-                    player_blocked += 1
-                    break
-            
-            # Score defensive value (blocking player)
-            if player_count >= 5:
-                score += 90000  # High but slightly less than AI win
-            elif player_count == 4 and player_blocked == 0:
-                score += 9000
-            elif player_count == 4 and player_blocked == 1:
-                score += 900
-            elif player_count == 3 and player_blocked == 0:
-                score += 450
-            elif player_count == 3 and player_blocked == 1:
-                score += 90
-            elif player_count == 2 and player_blocked == 0:
-                score += 45
-                
-            self.board[row][col] = 2  # Switch back to AI stone for next direction check
-        
-        # Reset the position to empty
-        self.board[row][col] = 0
-        
+        score = 0
+        for pattern in ai_patterns:
+            score += QUICK_AI_SCORES[pattern]
+        # Defensive value: what the player would get here
+        for pattern in self._pattern_classes(row, col, 1):
+            score += QUICK_PLAYER_SCORES[pattern]
         return score
 
-    def minimax(self, depth, alpha, beta, maximizing_player):
+    def _ordered_moves(self, tt_move, ply, player):
+        """Moves for minimax in search order; the static list is only built if the TT move did not cut off"""
+        # Guard against a Zobrist collision handing us an occupied cell
+        if tt_move is not None and self.board[tt_move[0]][tt_move[1]] == 0:
+            yield tt_move
+        scored_moves = self._scored_relevant_moves()
+        if self.move_ordering == "heuristic":
+            killers = self.killers[ply] if ply < len(self.killers) else ()
+            history = self.history[player]
+            # Killers first, then the static order with history scores breaking its ties
+            scored_moves.sort(key=lambda item: (item[0] in killers, item[1], history[item[0][0]][item[0][1]]),
+                              reverse=True)
+        for move, _ in scored_moves:
+            if move != tt_move:
+                yield move
+
+    def _record_cutoff(self, move, ply, player, depth):
+        """Remember a move that caused a beta cutoff for ordering its siblings"""
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        self.history[player][move[0]][move[1]] += depth * depth
+
+    def minimax(self, depth, alpha, beta, maximizing_player, ply=1):
         """Minimax algorithm with alpha-beta pruning and transposition table"""
-        # Create a unique hash for the current board state
-        board_hash = hash(self.board.tobytes())
-        tt_key = (board_hash, depth, maximizing_player)
+        if self.stop_search or (self.deadline is not None and time.perf_counter() > self.deadline):
+            raise SearchTimeout()
+        self.nodes += 1
+        
+        # The incrementally maintained Zobrist key identifies the board state
+        tt_key = self.zobrist_hash ^ ZOBRIST_SIDE if maximizing_player else self.zobrist_hash
+        alpha_orig, beta_orig = alpha, beta
         
-        # Check transposition table
-        if tt_key in self.transposition_table:
-            return self.transposition_table[tt_key]
+        # Check transposition table; scores are only reused at the same depth,
+        # so a table kept warm from earlier moves never changes a fixed-depth result
+        entry = self.transposition_table.probe(tt_key)
+        tt_move = entry[3] if entry is not None and self.move_ordering == "heuristic" else None
+        if entry is not None and entry[0] == depth:
+            _, flag, score, _ = entry
+            if flag == EXACT:
+                return score
+            if flag == LOWER:
+                alpha = max(alpha, score)
+            else:
+                beta = min(beta, score)
+            if beta <= alpha:
+                return score
             
         # Check terminal conditions
         if depth == 0 or self.check_winner(1, self.last_move) or self.check_winner(2, self.last_move) or self.is_board_full():
             eval_score = self.evaluate_board()
-            self.transposition_table[tt_key] = eval_score
+            self.transposition_table.store(tt_key, depth, EXACT, eval_score, None)
             return eval_score
+        
+        # A side to move that wins by continuous fours needs no full-width search
+        vcf = self.threat_solver.vcf(2 if maximizing_player else 1, SEARCH_VCF_DEPTH, SEARCH_VCF_NODES)
+        if vcf:
+            score = WIN_SCORE if maximizing_player else -WIN_SCORE
+            self.transposition_table.store(tt_key, depth, EXACT, score, vcf[0])
+            return score
             
-        moves = self.get_relevant_moves()
+        best_move = None
         
         if maximizing_player:
-            max_eval = float('-inf')
-            for move in moves:
-                row, col = move
-                self.board[row][col] = 2
-                self.last_move = (row, col)
-                eval = self.minimax(depth - 1, alpha, beta, False)
-                self.board[row][col] = 0
-                max_eval = max(max_eval, eval)
+            best_eval = float('-inf')
+            for move in self._ordered_moves(tt_move, ply, 2):
+                self.push(move, 2)
+                try:
+                    eval = self.minimax(depth - 1, alpha, beta, False, ply + 1)
+                finally:
+                    self.pop()
+                if eval > best_eval:
+                    best_eval = eval
+                    best_move = move
                 alpha = max(alpha, eval)
                 if beta <= alpha:
+                    self._record_cutoff(move, ply, 2, depth)
                     break
-            self.transposition_table[tt_key] = max_eval
-            return max_eval
         else:
-            min_eval = float('inf')
-            for move in moves:
-                row, col = move
-                self.board[row][col] = 1
-                self.last_move = (row, col)
-                eval = self.minimax(depth - 1, alpha, beta, True)
-                self.board[row][col] = 0
-                min_eval = min(min_eval, eval)
+            best_eval = float('inf')
+            for move in self._ordered_moves(tt_move, ply, 1):
+                self.push(move, 1)
+                try:
+                    eval = self.minimax(depth - 1, alpha, beta, True, ply + 1)
+                finally:
+                    self.pop()
+                if eval < best_eval:
+                    best_eval = eval
+                    best_move = move
                 beta = min(beta, eval)
                 if beta <= alpha:
+                    self._record_cutoff(move, ply, 1, depth)
                     break
-            self.transposition_table[tt_key] = min_eval
-            return min_eval
+        
+        # Scores outside the original window are only bounds on the true value
+        if best_eval <= alpha_orig:
+            flag = UPPER
+        elif best_eval >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.transposition_table.store(tt_key, depth, flag, best_eval, best_move)
+        return best_eval
 
-    def find_best_move(self, depth=3):
-        """Find the best move using prioritized strategy"""
-        # Optimization: Clear cache for new evaluation
-        self.pattern_cache = {}
-        self.transposition_table = {}
+    def negamax(self, depth, alpha, beta, color, ply=1):
+        """Principal variation search; color is 1 with the AI to move and -1 with the player
+
+        Scores are for the side to move. The transposition table keeps them
+        for the AI, as minimax stores them, so an entry means the same to
+        both searches.
+        """
+        if self.stop_search or (self.deadline is not None and time.perf_counter() > self.deadline):
+            raise SearchTimeout()
+        self.nodes += 1
+
+        maximizing_player = color == 1
+        tt_key = self.zobrist_hash ^ ZOBRIST_SIDE if maximizing_player else self.zobrist_hash
+        alpha_orig, beta_orig = alpha, beta
+
+        entry = self.transposition_table.probe(tt_key)
+        tt_move = entry[3] if entry is not None and self.move_ordering == "heuristic" else None
+        if entry is not None and entry[0] == depth:
+            _, flag, score, _ = entry
+            score *= color
+            # A lower bound for the AI is an upper bound for the player
+            if flag != EXACT and color < 0:
+                flag = UPPER if flag == LOWER else LOWER
+            if flag == EXACT:
+                return score
+            if flag == LOWER:
+                alpha = max(alpha, score)
+            else:
+                beta = min(beta, score)
+            if beta <= alpha:
+                return score
+
+        if depth == 0 or self.check_winner(1, self.last_move) or self.check_winner(2, self.last_move) or self.is_board_full():
+            eval_score = self.evaluate_board()
+            self.transposition_table.store(tt_key, depth, EXACT, eval_score, None)
+            return eval_score * color
+
+        player = 2 if maximizing_player else 1
+        vcf = self.threat_solver.vcf(player, SEARCH_VCF_DEPTH, SEARCH_VCF_NODES)
+        if vcf:
+            self.transposition_table.store(tt_key, depth, EXACT, WIN_SCORE * color, vcf[0])
+            return WIN_SCORE
+
+        best_score = float('-inf')
+        best_move = None
+        for move in self._ordered_moves(tt_move, ply, player):
+            self.push(move, player)
+            try:
+                if best_move is None:
+                    score = -self.negamax(depth - 1, -beta, -alpha, -color, ply + 1)
+                else:
+                    # Null window: prove the move is no better than alpha, or search it again in full
+                    score = -self.negamax(depth - 1, -alpha - 1, -alpha, -color, ply + 1)
+                    if alpha < score < beta:
+                        score = -self.negamax(depth - 1, -beta, -alpha, -color, ply + 1)
+            finally:
+                self.pop()
+            if score > best_score:
+                best_score = score
+                best_move = move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                self._record_cutoff(move, ply, player, depth)
+                break
+
+        if best_score <= alpha_orig:
+            flag = UPPER if color > 0 else LOWER
+        elif best_score >= beta_orig:
+            flag = LOWER if color > 0 else UPPER
+        else:
+            flag = EXACT
+        self.transposition_table.store(tt_key, depth, flag, best_score * color, best_move)
+        return best_score
+
+    def enable_stats(self):
+        """Collect SearchStats for every find_best_move; read them with stats.report()"""
+        if self.stats is None:
+            self.stats = SearchStats(self)
+            self.stats.attach()
+
+    def disable_stats(self):
+        if self.stats is not None:
+            self.stats.detach()
+            self.stats = None
+
+    def close(self):
+        """Shut down the worker processes of a parallel search"""
+        if self.root_splitter:
+            self.root_splitter.close()
+            self.root_splitter = None
+
+    def _search_root(self, moves, depth, alpha=float('-inf'), beta=float('inf'), ranks=None):
+        """Score every root move with minimax; returns the best move and its score
+
+        With search="pvs" the moves after the first get a null window, and a
+        score outside (alpha, beta) is only a bound; the process pool always
+        searches the full window. Ties go to the first move in moves, or to
+        the lowest of ranks, a dict of move to its place in the order the
+        moves were generated, when they have been reordered since.
+        """
+        if self.root_splitter:
+            return self.root_splitter.search_root(self, moves, depth, ranks)
+        if self.search == "pvs":
+            return self._search_root_pvs(moves, depth, alpha, beta, ranks)
+        best_score = float('-inf')
+        best_move = None
+        for move in moves:
+            # A move ranked before the best one wins a tie, so it needs its exact score at best_score
+            tie = ranks is not None and best_move is not None and ranks[move] < ranks[best_move]
+            self.push(move, 2)
+            try:
+                score = self.minimax(depth - 1, best_score - 1 if tie else best_score, float('inf'), False)
+            finally:
+                self.pop()
+            if score > best_score or (tie and score == best_score):
+                best_score = score
+                best_move = move
+        return best_move, best_score
+
+    def _search_iteration(self, moves, depth, score, ranks=None):
+        """_search_root with an aspiration window around score, the last estimate, under PVS"""
+        if self.search != "pvs" or score is None or self.root_splitter:
+            return self._search_root(moves, depth, ranks=ranks)
+        # A score on or outside the window is only a bound, so search again in full
+        alpha, beta = score - ASPIRATION_WINDOW, score + ASPIRATION_WINDOW
+        move, new_score = self._search_root(moves, depth, alpha, beta, ranks)
+        if new_score <= alpha or new_score >= beta:
+            move, new_score = self._search_root(moves, depth, ranks=ranks)
+        return move, new_score
+
+    def _search_root_pvs(self, moves, depth, alpha, beta, ranks=None):
+        best_score = float('-inf')
+        best_move = None
+        for move in moves:
+            tie = ranks is not None and best_move is not None and ranks[move] < ranks[best_move]
+            self.push(move, 2)
+            try:
+                if best_move is None:
+                    score = -self.negamax(depth - 1, -beta, -alpha, -1)
+                else:
+                    # Null window just below alpha for a move that would win a tie at alpha
+                    low = alpha - 1 if tie else alpha
+                    score = -self.negamax(depth - 1, -low - 1, -low, -1)
+                    if low < score < beta:
+                        score = -self.negamax(depth - 1, -beta, -low, -1)
+            finally:
+                self.pop()
+            if score > best_score or (tie and score == best_score):
+                best_score = score
+                best_move = move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+        return best_move, best_score
+
+    def _principal_variation(self, move, depth):
+        """move and the best replies below it, as the iteration of depth left them in the table"""
+        line = []
+        player = 2
+        try:
+            while move is not None and self.is_valid_move(*move) and len(line) < depth:
+                self.push(move, player)
+                line.append(move)
+                player = 3 - player
+                # Only exact entries of this iteration's depth are on its principal variation
+                entry = self.transposition_table.probe(self.zobrist_hash ^ ZOBRIST_SIDE if player == 2
+                                                       else self.zobrist_hash)
+                move = entry[3] if entry is not None and entry[0] == depth - len(line) and entry[1] == EXACT else None
+        finally:
+            for _ in line:
+                self.pop()
+        return line
+
+    def _expect_reply(self, line, depth, score):
+        """Keep line, found by an iteration of depth, and the position after its expected reply
+
+        Two plies into the line the iteration has already searched depth - 2
+        plies, so the next find_best_move starts deeper there if the player
+        does play the reply.
+        """
+        self.completed_depth = depth
+        self.search_score = score
+        self.principal_variation = line
+        self.continuation = None
+        if len(line) > 2:
+            self.push(line[0], 2)
+            self.push(line[1], 1)
+            self.continuation = (self.zobrist_hash, depth - 2, score, line[2:])
+            self.pop()
+            self.pop()
+
+    def predicted_reply(self):
+        """The move the player (1) is expected to play next, the player being to move
+
+        The transposition table's best move for the position if the last
+        search reached it, else a five to complete or block, else the top
+        candidate.
+        """
+        entry = self.transposition_table.probe(self.zobrist_hash)
+        if entry is not None and entry[3] is not None and self.is_valid_move(*entry[3]):
+            return entry[3]
+        moves = self.get_relevant_moves()
+        return self.check_immediate_threat(1) or self.check_immediate_threat(2) or (moves[0] if moves else None)
+
+    def ponder(self, move, time_limit_ms=PONDER_LIMIT_MS):
+        """Search the AI's reply to the player playing move until stop_search is set or time runs out
+
+        This is find_best_move with time_limit_ms on the position after move,
+        which is taken back before returning. What it leaves in the
+        transposition table is there for the real search if the player does
+        play move. Returns the reply of the deepest finished iteration, or
+        None if stopped before there was one.
+
+        With search="mcts" it does nothing and returns None: the search would
+        re-root the shared tree on move and drop every other reply's subtree.
+        """
+        if self.mcts:
+            return None
+        continuation = self.continuation
+        self.push(move, 1)
+        try:
+            reply = self.find_best_move(time_limit_ms=time_limit_ms)
+            # The real search carries on from here if the player does play move
+            self.continuation = (self.zobrist_hash, self.completed_depth, self.search_score,
+                                 self.principal_variation)
+            return reply
+        except SearchTimeout:
+            self.continuation = continuation
+            return None
+        finally:
+            self.pop()
+
+    def find_best_move(self, depth=3, time_limit_ms=None):
+        """Find the best move using prioritized strategy
+
+        With time_limit_ms the search deepens 1, 2, 3, ... instead of using depth,
+        and returns the best move of the deepest iteration finished in time.
+        """
+        start = time.perf_counter()
+        # Pattern results and the transposition table are keyed by position, so
+        # both are kept and later moves of the game start from a warm cache
+        if len(self.pattern_cache) > PATTERN_CACHE_ENTRIES:
+            self.pattern_cache.clear()
+        self.threat_solver.cache = {}
+        self.nodes = 0
+        self.completed_depth = 0
+        self.search_score = None
+        self.principal_variation = []
+        self.reused_depth = 0
+        continuation, self.continuation = self.continuation, None
+        # Killers are per ply of this search; history scores are aged, not dropped
+        self.killers = []
+        for table in self.history:
+            for history_row in table:
+                history_row[:] = [score >> 1 for score in history_row]
+        
+        # 0. Early positions are answered from the opening book without searching
+        if self.opening_book:
+            book_move = self.opening_book.lookup(self)
+            if book_move:
+                return book_move
         
         # 1. Check if AI can win immediately
         ai_win = self.check_immediate_threat(2)
@@ -563,28 +773,81 @@ class GomokuLogic:
         open_four_move = self.find_open_four_move(2)
         if open_four_move:
             return open_four_move
+        
+        # 4. Look for a forced win by continuous fours, then by fours and threes;
+        # under a time limit the threat search gets THREAT_TIME_SHARE of it
+        self.deadline = start + THREAT_TIME_SHARE * time_limit_ms / 1000 if time_limit_ms is not None else None
+        try:
+            forced_win = self.threat_solver.vcf(2) or self.threat_solver.vct(2)
+        finally:
+            self.deadline = None
+        if forced_win:
+            return forced_win[0]
             
-        # 4. Check if player has an open three and block it
+        # 5. Check if player has an open three and block it
         block_move = self.find_block_open_three_move(2)
         if block_move:
             return block_move
             
-        # 5. Use minimax with alpha-beta pruning for other situations
-        best_score = float('-inf')
-        best_move = None
+        # 6. Use MCTS if selected, otherwise minimax with alpha-beta pruning
+        if self.mcts:
+            self.deadline = start + time_limit_ms / 1000 if time_limit_ms is not None else None
+            try:
+                return self.mcts.best_move()
+            finally:
+                self.nodes = self.mcts.playouts
+                self.completed_depth = self.mcts.depth
+                self.deadline = None
+
         moves = self.get_relevant_moves()
+        ranks = None
+        # The position the last search expected, or the one ponder() searched: its principal
+        # variation's move is searched first, with its score as the first PVS estimate
+        carried = None
+        if (continuation and continuation[0] == self.zobrist_hash and continuation[3] and
+                continuation[3][0] in moves):
+            carried = continuation
+            ranks = {move: index for index, move in enumerate(moves)}
+            moves.remove(carried[3][0])
+            moves.insert(0, carried[3][0])
         
-        # Use iterative deepening if there are many moves to consider
-        actual_depth = min(depth, 4 if len(moves) < 8 else 3)
+        if time_limit_ms is None:
+            # Limit the depth if there are many moves to consider
+            actual_depth = min(depth, 4 if len(moves) < 8 else 3)
+            # Ties still go by the generated order, so a fixed depth gives the same move as without the line
+            best_move, score = self._search_iteration(moves, actual_depth, carried[2] if carried else None, ranks)
+            self.completed_depth = actual_depth
+            if not best_move:
+                return moves[0]
+            self._expect_reply(self._principal_variation(best_move, actual_depth), actual_depth, score)
+            return best_move
         
-        for move in moves:
-            row, col = move
-            self.board[row][col] = 2
-            self.last_move = (row, col)
-            score = self.minimax(actual_depth - 1, float('-inf'), float('inf'), False)
-            self.board[row][col] = 0
-            if score > best_score:
-                best_score = score
-                best_move = move
-                
-        return best_move if best_move else moves[0]
\ No newline at end of file
+        # Iterative deepening: each finished iteration's best move is searched first in the next
+        best_move = moves[0]
+        score = None
+        first_depth = 1
+        if carried:
+            # Carry on after the deepest iteration already finished; redoing the shallow ones
+            # would overwrite the same-depth table entries it left
+            best_move = carried[3][0]
+            score = carried[2]
+            first_depth = carried[1] + 1
+            self.reused_depth = carried[1]
+            self._expect_reply(list(carried[3]), carried[1], score)
+        deadline = start + time_limit_ms / 1000
+        try:
+            for current_depth in range(first_depth, self.size * self.size - len(self.move_history) + 1):
+                # The first iteration always finishes, so the answer is never an unsearched move
+                self.deadline = deadline if self.completed_depth else None
+                move, score = self._search_iteration(moves, current_depth, score)
+                self.completed_depth = current_depth
+                if move:
+                    best_move = move
+                    moves.remove(move)
+                    moves.insert(0, move)
+                    self._expect_reply(self._principal_variation(move, current_depth), current_depth, score)
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+        return best_move
\ No newline at end of file
@@ -0,0 +1,382 @@
+import math
+import random
+import time
+
+# UCT exploration constant; node values are win rates in [0, 1]
+EXPLORATION = 1.0
+# Playouts per search when find_best_move has no time limit
+ROLLOUTS = 5000
+# A leaf gets its children on this visit; earlier visits only play out from it
+EXPAND_VISITS = 2
+# The tree stops growing at this many nodes; playouts still run from its leaves
+MAX_NODES = 500000
+# Fixed seed so a playout budget picks the same move on every run
+MCTS_SEED = 0x5EED
+# Playout and tree moves are the empty cells within this many rows and columns of a stone
+RADIUS = 1
+WALL = 3
+# Per player threat cell lists of a search state, see _note_threats
+FIVES, FOURS, OPEN_FOURS, OPEN_THREES = range(4)
+
+_layouts = {}
+
+
+def board_layout(size):
+    """Flat board shared per size, one wall column and a wall row above and below
+
+    Returns the empty board (WALL off the board), the four line steps, the
+    neighbours of each cell within RADIUS and the (row, col) of each index.
+    A run along a line stops at a wall, so no bounds checks are needed.
+    """
+    if size not in _layouts:
+        width = size + 1
+        board = [WALL] * ((size + 2) * width + 1)
+        near = [()] * len(board)
+        cells = [None] * len(board)
+        for row in range(size):
+            for col in range(size):
+                index = (row + 1) * width + col
+                board[index] = 0
+                cells[index] = (row, col)
+                near[index] = tuple((r + 1) * width + c
+                                    for r in range(max(0, row - RADIUS), min(size, row + RADIUS + 1))
+                                    for c in range(max(0, col - RADIUS), min(size, col + RADIUS + 1))
+                                    if (r, c) != (row, col))
+        _layouts[size] = (board, (1, width, width + 1, width - 1), near, cells)
+    return _layouts[size]
+
+
+def _place(board, counts, cand, where, threats, near, steps, move, player):
+    """Play player's stone at move and note the threat cells it makes
+
+    cand lists the empty cells next to a stone and where[cell] is each one's
+    position in it (-1 if absent), so removal is a swap with the last entry.
+    """
+    board[move] = player
+    k = where[move]
+    if k >= 0:
+        last = cand.pop()
+        if last != move:
+            cand[k] = last
+            where[last] = k
+        where[move] = -1
+    for cell in near[move]:
+        counts[cell] += 1
+        if counts[cell] == 1 and not board[cell]:
+            where[cell] = len(cand)
+            cand.append(cell)
+    _note_threats(board, threats[player], steps, move, player)
+
+
+def _note_threats(board, lists, steps, move, player):
+    """Add the cells next to the line runs through player's stone at move to lists
+
+    lists holds, for the player, the cells that complete five (FIVES), make a
+    four with an open end (FOURS), an open four (OPEN_FOURS) or an open three
+    (OPEN_THREES): the first empty cell past the stone's run on either side,
+    joined to the run beyond it. They are never pruned; a cell is checked
+    again when it is read, as later stones may have filled or blocked it.
+    """
+    fives, fours, open_fours, threes = lists
+    for step in steps:
+        ahead = move + step
+        while board[ahead] == player:
+            ahead += step
+        behind = move - step
+        while board[behind] == player:
+            behind -= step
+        run = (ahead - behind) // step - 1
+        if not board[ahead]:
+            end = ahead + step
+            while board[end] == player:
+                end += step
+            # Stones the cell joins, and the open ends of the block it would make
+            stones = run + (end - ahead) // step - 1
+            if stones >= 4:
+                fives.append(ahead)
+            elif stones >= 2:
+                ends = (not board[behind]) + (not board[end])
+                if stones == 3:
+                    if ends:
+                        fours.append(ahead)
+                    if ends == 2:
+                        open_fours.append(ahead)
+                elif ends == 2:
+                    threes.append(ahead)
+        if not board[behind]:
+            end = behind - step
+            while board[end] == player:
+                end -= step
+            stones = run + (behind - end) // step - 1
+            if stones >= 4:
+                fives.append(behind)
+            elif stones >= 2:
+                ends = (not board[ahead]) + (not board[end])
+                if stones == 3:
+                    if ends:
+                        fours.append(behind)
+                    if ends == 2:
+                        open_fours.append(behind)
+                elif ends == 2:
+                    threes.append(behind)
+
+
+def _makes(board, cell, player, steps, stones, ends):
+    """Whether player's stone at cell would join a block of stones with at least ends open ends"""
+    for step in steps:
+        ahead = cell + step
+        while board[ahead] == player:
+            ahead += step
+        behind = cell - step
+        while board[behind] == player:
+            behind -= step
+        if (ahead - behind) // step - 1 >= stones and (not board[ahead]) + (not board[behind]) >= ends:
+            return True
+    return False
+
+
+def _pattern_move(board, cells, player, steps, stones, ends):
+    """Last cell of cells where player still makes such a block, dropping the others; -1 if none"""
+    while cells:
+        cell = cells.pop()
+        if not board[cell] and _makes(board, cell, player, steps, stones, ends):
+            return cell
+    return -1
+
+
+def _live(board, wins):
+    """Last cell of wins still empty, dropping filled ones from the end; -1 if none"""
+    while wins:
+        if not board[wins[-1]]:
+            return wins[-1]
+        wins.pop()
+    return -1
+
+
+def _rollout(board, counts, cand, where, threats, near, steps, player, random):
+    """Play the game out and return the winner, 0 for a draw
+
+    Each side completes a five when it can and blocks the opponent's five
+    when it must. Otherwise it makes a four, blocks the cell where the
+    opponent would make an open four, or makes an open three, in that
+    order, and only then plays a random empty cell next to a stone.
+    """
+    while cand:
+        own, other = threats[player], threats[3 - player]
+        if _live(board, own[FIVES]) >= 0:
+            return player
+        move = _live(board, other[FIVES])
+        if move < 0:
+            move = _pattern_move(board, own[FOURS], player, steps, 4, 1)
+        if move < 0:
+            move = _pattern_move(board, other[OPEN_FOURS], 3 - player, steps, 4, 2)
+        if move < 0:
+            move = _pattern_move(board, own[OPEN_THREES], player, steps, 3, 2)
+        if move < 0:
+            move = cand[int(random() * len(cand))]
+        _place(board, counts, cand, where, threats, near, steps, move, player)
+        player = 3 - player
+    return 0
+
+
+class MCTS:
+    """Monte Carlo tree search (UCT) for the AI's move on a GomokuLogic position
+
+    The tree lives in parallel lists indexed by node: the move into it, its
+    visits, the playouts won by the side that made that move (draws count
+    half), a finished game's result, and its children as a contiguous run
+    first[node] .. first[node] + count[node] - 1. Node 0 is the position
+    after move_history[:len(self.history)] with the AI to move; the next
+    search walks down the moves played since and keeps only that subtree.
+
+    The tree and the playouts share one rule: a side with a five to make
+    makes it, and a side facing one blocks it. Otherwise every empty cell
+    next to a stone is a child, and playouts prefer fours and open threes
+    before picking among them at random (see _rollout).
+    """
+
+    def __init__(self, logic, rollouts=ROLLOUTS):
+        self.logic = logic
+        self.rollouts = rollouts
+        self.random = random.Random(MCTS_SEED)
+        self.empty, self.steps, self.near, self.cells = board_layout(logic.size)
+        self.history = None
+        self.playouts = 0  # Playouts run by the last search
+        self.depth = 0  # Deepest tree node the last search reached
+        self._new_tree()
+
+    def _new_tree(self):
+        self.moves = [-1]
+        self.visits = [0]
+        self.wins = [0.0]
+        self.results = [None]
+        self.first = [0]
+        self.count = [0]
+
+    def __len__(self):
+        return len(self.moves)
+
+    def best_move(self):
+        """Most visited move after self.rollouts playouts, or until logic.deadline if it is set"""
+        from Logic import SearchTimeout
+        logic = self.logic
+        self._advance_root()
+        board, counts, cand, where, threats = self._root_state()
+        if not cand and not logic.move_history:
+            return (logic.size // 2, logic.size // 2)
+        moves, visits, wins, results, first, count = (self.moves, self.visits, self.wins, self.results,
+                                                      self.first, self.count)
+        near, steps, random = self.near, self.steps, self.random.random
+        self.playouts = 0
+        self.depth = 0
+        while True:
+            if logic.stop_search:
+                raise SearchTimeout()
+            if logic.deadline is not None:
+                if time.perf_counter() > logic.deadline:
+                    break
+            elif self.playouts >= self.rollouts:
+                break
+            state = (board[:], counts[:], cand[:], where[:],
+                     [None, [cells[:] for cells in threats[1]], [cells[:] for cells in threats[2]]], near, steps)
+            node = 0
+            player = 2
+            path = [0]
+            while count[node]:
+                node = self._select(node)
+                _place(*state, moves[node], player)
+                player = 3 - player
+                path.append(node)
+            if results[node] is None and (visits[node] + 1 >= EXPAND_VISITS or node == 0):
+                self._expand(node, state, player)
+                if count[node]:
+                    node = first[node]
+                    _place(*state, moves[node], player)
+                    player = 3 - player
+                    path.append(node)
+            result = results[node]
+            if result is None:
+                result = _rollout(*state, player, random)
+            self.playouts += 1
+            self.depth = max(self.depth, len(path) - 1)
+            # Node i of the path was entered by player 2 if i is odd, by player 1 if even
+            mover = 1
+            for node in path:
+                visits[node] += 1
+                if result == mover:
+                    wins[node] += 1.0
+                elif not result:
+                    wins[node] += 0.5
+                mover = 3 - mover
+        start = first[0]
+        if not count[0]:
+            return None
+        best = max(range(start, start + count[0]), key=lambda child: (visits[child], -child))
+        return self.cells[moves[best]]
+
+    def _root_state(self):
+        """Flat board, candidate cells and threat cells of the logic's position"""
+        logic = self.logic
+        size = logic.size
+        board = self.empty[:]
+        counts = [0] * len(board)
+        for row, col in logic.move_history:
+            index = (row + 1) * (size + 1) + col
+            board[index] = int(logic.board[row][col])
+            for cell in self.near[index]:
+                counts[cell] += 1
+        cand = [index for index in range(len(board)) if counts[index] and not board[index]]
+        where = [-1] * len(board)
+        for k, index in enumerate(cand):
+            where[index] = k
+        threats = [None, [[], [], [], []], [[], [], [], []]]
+        for row, col in logic.move_history:
+            index = (row + 1) * (size + 1) + col
+            _note_threats(board, threats[board[index]], self.steps, index, board[index])
+        return board, counts, cand, where, threats
+
+    def _advance_root(self):
+        """Move node 0 down the moves played since the last search, or start a new tree"""
+        history = self.logic.move_history
+        played = len(self.history) if self.history is not None else -1
+        node = None
+        # The AI is to move at the root, so an even number of moves must have been played
+        if played >= 0 and history[:played] == self.history and (len(history) - played) % 2 == 0:
+            size = self.logic.size
+            node = 0
+            for row, col in history[played:]:
+                node = self._child(node, (row + 1) * (size + 1) + col)
+                if node is None:
+                    break
+        if node is None:
+            self._new_tree()
+        elif node:
+            self._keep_subtree(node)
+        self.history = list(history)
+
+    def _child(self, node, move):
+        for child in range(self.first[node], self.first[node] + self.count[node]):
+            if self.moves[child] == move:
+                return child
+        return None
+
+    def _keep_subtree(self, root):
+        """Rebuild the lists with root as node 0 and only its descendants, children still contiguous"""
+        old = (self.moves, self.visits, self.wins, self.results, self.first, self.count)
+        self._new_tree()
+        new = (self.moves, self.visits, self.wins, self.results, self.first, self.count)
+        for values, old_values in zip(new[:4], old[:4]):
+            values[0] = old_values[root]
+        queue = [(root, 0)]
+        for old_node, node in queue:
+            self.first[node] = len(self.moves)
+            self.count[node] = old[5][old_node]
+            start = old[4][old_node]
+            for old_child in range(start, start + old[5][old_node]):
+                queue.append((old_child, len(self.moves)))
+                for values, old_values in zip(new[:4], old[:4]):
+                    values.append(old_values[old_child])
+                self.first.append(0)
+                self.count.append(0)
+
+    def _select(self, node):
+        """UCT child of node; unvisited children first, in order"""
+        visits = self.visits
+        wins = self.wins
+        start = self.first[node]
+        log_visits = math.log(visits[node])
+        best_value = -1.0
+        best = start
+        for child in range(start, start + self.count[node]):
+            n = visits[child]
+            if not n:
+                return child
+            value = wins[child] / n + EXPLORATION * math.sqrt(log_visits / n)
+            if value > best_value:
+                best_value = value
+                best = child
+        return best
+
+    def _expand(self, node, state, player):
+        """Give node its children for player to move; a node with no moves left is a draw"""
+        board, _, cand, _, threats = state[:5]
+        win = _live(board, threats[player][FIVES])
+        if win >= 0:
+            children = [win]
+        else:
+            # Facing a five, only the blocks are worth a child
+            children = sorted({cell for cell in threats[3 - player][FIVES] if not board[cell]}) or sorted(cand)
+        if not children:
+            self.results[node] = 0
+            return
+        if len(self.moves) + len(children) > MAX_NODES:
+            return
+        self.first[node] = len(self.moves)
+        self.count[node] = len(children)
+        for move in children:
+            self.moves.append(move)
+            self.visits.append(0)
+            self.wins.append(0.0)
+            self.results.append(player if move == win else None)
+            self.first.append(0)
+            self.count.append(0)
@@ -0,0 +1,135 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Each worker process keeps one engine, and with it its transposition table,
+# for as long as the positions it is sent continue the same game
+_engine = None
+# Shared with the parent: the number of the root search the workers are working for.
+# A task sent for an earlier search stops as soon as the number moves on.
+_search_number = None
+# How often a running task checks _search_number, in seconds
+STOP_POLL = 0.02
+
+
+def _init_worker(search_number):
+    global _search_number
+    _search_number = search_number
+
+
+def _sync_engine(size, stones):
+    """The worker's engine set to the position reached by stones, a list of (row, col, player)"""
+    global _engine
+    from Logic import GomokuLogic
+    played = len(_engine.move_history) if _engine else 0
+    if (_engine is None or _engine.size != size or played > len(stones) or
+            any(_engine.board[r][c] != player for r, c, player in stones[:played])):
+        _engine = GomokuLogic(size=size)
+        played = 0
+    if played < len(stones):
+        for row, col, player in stones[played:]:
+            _engine.make_move(row, col, player)
+        # A new root position, as find_best_move would start it
+        _engine.threat_solver.cache = {}
+        _engine.killers = []
+    return _engine
+
+
+def _watch_search(engine, number, done):
+    """Set the engine's stop_search once the parent has moved past search number, until done is set"""
+    while not done.wait(STOP_POLL):
+        if _search_number.value != number:
+            engine.stop_search = True
+            return
+
+
+def _search_move(size, stones, move, depth, alpha, seconds, search="minimax", number=0):
+    """Minimax score of the AI playing move (None if stopped or seconds ran out first) and the nodes searched"""
+    from Logic import SearchTimeout
+    engine = _sync_engine(size, stones)
+    engine.deadline = time.perf_counter() + seconds if seconds is not None else None
+    engine.stop_search = _search_number.value != number
+    engine.nodes = 0
+    done = threading.Event()
+    watcher = threading.Thread(target=_watch_search, args=(engine, number, done), daemon=True)
+    watcher.start()
+    engine.push(tuple(move), 2)
+    try:
+        if search == "pvs":
+            return -engine.negamax(depth - 1, float('-inf'), -alpha, -1), engine.nodes
+        return engine.minimax(depth - 1, alpha, float('inf'), False), engine.nodes
+    except SearchTimeout:
+        return None, engine.nodes
+    finally:
+        engine.pop()
+        engine.deadline = None
+        done.set()
+        watcher.join()
+        engine.stop_search = False
+
+
+class RootSplitter:
+    """Scores the root moves of GomokuLogic._search_root in a process pool
+
+    Every move is searched with alpha one below the best score known when it
+    is sent out, so a move that ties the best still gets its exact score.
+    Ties go to the earlier root move, which is what the serial loop picks,
+    and the answer at a fixed depth is the same as the serial search's.
+
+    Each search_root has a number shared with the workers. When it ends,
+    stopped or not, the number moves on, so tasks still running or queued
+    for it stop within STOP_POLL instead of delaying the next search.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.search_number = multiprocessing.Value("i", 0)
+        self.pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(self.search_number,))
+
+    def close(self):
+        # Pending tasks were cancelled by search_root; queued or running ones see the new number and stop
+        with self.search_number.get_lock():
+            self.search_number.value += 1
+        self.pool.shutdown()
+
+    def search_root(self, logic, moves, depth, ranks=None):
+        """Best move and score, as GomokuLogic._search_root returns them, ties going by ranks if given"""
+        from Logic import SearchTimeout
+        stones = [(row, col, int(logic.board[row][col])) for row, col in logic.move_history]
+        best_score = float('-inf')
+        best_index = None
+        pending = {}
+        next_index = 0
+        number = self.search_number.value
+        try:
+            while next_index < len(moves) or pending:
+                # Keep every worker busy; later moves start with a better alpha
+                while next_index < len(moves) and len(pending) < self.workers:
+                    seconds = None
+                    if logic.deadline is not None:
+                        seconds = max(0.0, logic.deadline - time.perf_counter())
+                    future = self.pool.submit(_search_move, logic.size, stones, moves[next_index],
+                                              depth, best_score - 1, seconds, logic.search, number)
+                    pending[future] = next_index
+                    next_index += 1
+                done, _ = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+                if logic.stop_search or (logic.deadline is not None and time.perf_counter() > logic.deadline):
+                    raise SearchTimeout()
+                for future in done:
+                    index = pending.pop(future)
+                    score, nodes = future.result()
+                    logic.nodes += nodes
+                    if score is None:
+                        raise SearchTimeout()
+                    earlier = best_index is not None and (ranks[moves[index]] < ranks[moves[best_index]] if ranks
+                                                          else index < best_index)
+                    if score > best_score or (score == best_score and earlier):
+                        best_score = score
+                        best_index = index
+        finally:
+            for future in pending:
+                future.cancel()
+            with self.search_number.get_lock():
+                self.search_number.value += 1
+        return (moves[best_index] if best_index is not None else None), best_score
@@ -0,0 +1,77 @@
+import itertools
+import numpy as np
+
+# Threat classes of a stone along one line, weakest to strongest
+NONE = 0
+OPEN_TWO = 1      # _XX__ style: two stones inside an open six-cell window
+CLOSED_THREE = 2  # three stones in a five-cell window, one move from a four
+BROKEN_THREE = 3  # _X_XX_ / _XX_X_: split three that still makes an open four
+OPEN_THREE = 4    # _XXX__ / __XXX_
+CLOSED_FOUR = 5   # four stones in a five-cell window: XXXX_, XXX_X, XX_XX
+OPEN_FOUR = 6     # _XXXX_
+FIVE = 7
+CLASS_NAMES = ["none", "open two", "closed three", "broken three", "open three",
+               "closed four", "open four", "five"]
+
+# A window is the 9 cells centred on a stone along one line, two bits per cell
+# (0 empty, 1 player, 2 AI, 3 off the board), cell -4 in the lowest bits. This
+# is the same layout as the line codes in Evaluator.py.
+WINDOW = 9
+CENTER = 4
+WINDOW_MASK = (1 << (2 * WINDOW)) - 1
+CENTER_SHIFT = 2 * CENTER
+
+
+def _classify(window):
+    """Threat class of the centre stone of a 9-character 'X', '_', '#' window"""
+    fives = [window[s:s + 5] for s in range(5)]
+    sixes = [window[s:s + 6] for s in range(4)]
+    if "XXXXX" in fives:
+        return FIVE
+    if "_XXXX_" in sixes:
+        return OPEN_FOUR
+    if any(w.count("X") == 4 and w.count("_") == 1 for w in fives):
+        return CLOSED_FOUR
+    if "_XXX__" in sixes or "__XXX_" in sixes:
+        return OPEN_THREE
+    if "_X_XX_" in sixes or "_XX_X_" in sixes:
+        return BROKEN_THREE
+    if any(w.count("X") == 3 and w.count("_") == 2 for w in fives):
+        return CLOSED_THREE
+    if any(w[0] == "_" and w[5] == "_" and w[1:5].count("X") == 2 and w[1:5].count("_") == 2 for w in sixes):
+        return OPEN_TWO
+    return NONE
+
+
+def _build_tables():
+    """One lookup table per player, indexed by window code, built once at import"""
+    # Classify every window from the stone owner's point of view: X own, _ empty, # blocked
+    ternary = np.zeros(3 ** WINDOW, dtype=np.uint8)
+    for cells in itertools.product(range(3), repeat=WINDOW - 1):
+        digits = cells[:CENTER] + (1,) + cells[CENTER:]
+        index = sum(d * 3 ** k for k, d in enumerate(digits))
+        ternary[index] = _classify("".join("_X#"[d] for d in digits))
+    codes = np.arange(4 ** WINDOW)
+    tables = [b""]
+    for player in (1, 2):
+        index = np.zeros_like(codes)
+        for k in range(WINDOW):
+            cell = (codes >> (2 * k)) & 3
+            digit = np.where(cell == player, 1, np.where(cell == 0, 0, 2))
+            index += digit * 3 ** k
+        # bytes indexing returns plain ints, cheaper than NumPy scalars in the hot loops
+        tables.append(ternary[index].tobytes())
+    return tables
+
+
+PATTERN_TABLES = _build_tables()
+
+
+def classify(window, player):
+    """Threat class for player's stone at the centre of a window code"""
+    return PATTERN_TABLES[player][window]
+
+
+def classify_move(window, player):
+    """Threat class player would get by placing a stone at the centre of a window code"""
+    return PATTERN_TABLES[player][(window & ~(3 << CENTER_SHIFT)) | (player << CENTER_SHIFT)]
@@ -0,0 +1,163 @@
+import time
+
+
+class CountingCache(dict):
+    """pattern_cache stand-in that counts membership tests and hits"""
+
+    def __init__(self, stats, entries=()):
+        super().__init__(entries)
+        self.stats = stats
+
+    def __contains__(self, key):
+        found = super().__contains__(key)
+        self.stats.cache_lookups += 1
+        self.stats.cache_hits += found
+        return found
+
+
+class SearchStats:
+    """Counters for one find_best_move, collected by wrapping a GomokuLogic's methods
+
+    attach() replaces find_best_move, minimax, negamax, evaluate_board,
+    _scored_relevant_moves, _ordered_moves, _record_cutoff and the threat
+    solver's vcf/vct with counting versions on that one instance, and
+    detach() removes them, so an engine without stats runs the plain
+    methods at no cost.
+    """
+
+    WRAPPED = ("find_best_move", "minimax", "negamax", "evaluate_board", "_scored_relevant_moves", "_ordered_moves",
+               "_record_cutoff")
+
+    def __init__(self, logic):
+        self.logic = logic
+        self.reset()
+
+    def reset(self):
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.nodes_by_ply = {}
+        self.expanded_by_ply = {}  # Nodes that generated moves
+        self.moves_by_ply = {}  # Moves searched, for the branching factor
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.leaf_evals = 0
+        self.generation_seconds = 0.0
+        self.evaluation_seconds = 0.0
+        self.threat_seconds = 0.0
+        self.cache_lookups = 0
+        self.cache_hits = 0
+        self._searched = {}  # Moves searched so far by the node being expanded at each ply
+        table = self.logic.transposition_table
+        self._table_start = (table.probes, table.hits, table.stores)
+        self.logic.pattern_cache = CountingCache(self, self.logic.pattern_cache)
+
+    def attach(self):
+        logic = self.logic
+        for name in self.WRAPPED:
+            setattr(logic, name, getattr(self, "_" + name.lstrip("_"))(getattr(logic, name)))
+        solver = logic.threat_solver
+        solver.vcf = self._timed_threats(solver.vcf)
+        solver.vct = self._timed_threats(solver.vct)
+
+    def detach(self):
+        for name in self.WRAPPED:
+            self.logic.__dict__.pop(name, None)
+        self.logic.threat_solver.__dict__.pop("vcf", None)
+        self.logic.threat_solver.__dict__.pop("vct", None)
+        self.logic.pattern_cache = dict(self.logic.pattern_cache)
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.start
+
+    def report(self):
+        """Counters of the last search as a plain dict"""
+        table = self.logic.transposition_table
+        probes = table.probes - self._table_start[0]
+        hits = table.hits - self._table_start[1]
+        expanded = sum(self.expanded_by_ply.values())
+        return {
+            "seconds": self.seconds,
+            "nodes": sum(self.nodes_by_ply.values()),
+            "nodes_by_ply": dict(sorted(self.nodes_by_ply.items())),
+            "leaf_evals": self.leaf_evals,
+            "tt_probes": probes,
+            "tt_hits": hits,
+            "tt_stores": table.stores - self._table_start[2],
+            "tt_hit_rate": hits / probes if probes else 0.0,
+            "cache_lookups": self.cache_lookups,
+            "cache_hits": self.cache_hits,
+            "cutoffs": self.cutoffs,
+            "first_move_cutoff_rate": self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0,
+            "branching_by_ply": {ply: self.moves_by_ply[ply] / self.expanded_by_ply[ply]
+                                 for ply in sorted(self.expanded_by_ply)},
+            "branching": sum(self.moves_by_ply.values()) / expanded if expanded else 0.0,
+            "generation_seconds": self.generation_seconds,
+            "evaluation_seconds": self.evaluation_seconds,
+            "threat_seconds": self.threat_seconds,
+        }
+
+    def _find_best_move(self, find_best_move):
+        def measured(*args, **kwargs):
+            self.reset()
+            try:
+                return find_best_move(*args, **kwargs)
+            finally:
+                self.finish()
+        return measured
+
+    def _minimax(self, minimax):
+        def counted(depth, alpha, beta, maximizing_player, ply=1):
+            self.nodes_by_ply[ply] = self.nodes_by_ply.get(ply, 0) + 1
+            return minimax(depth, alpha, beta, maximizing_player, ply)
+        return counted
+
+    def _negamax(self, negamax):
+        def counted(depth, alpha, beta, color, ply=1):
+            self.nodes_by_ply[ply] = self.nodes_by_ply.get(ply, 0) + 1
+            return negamax(depth, alpha, beta, color, ply)
+        return counted
+
+    def _evaluate_board(self, evaluate_board):
+        def counted():
+            self.leaf_evals += 1
+            start = time.perf_counter()
+            try:
+                return evaluate_board()
+            finally:
+                self.evaluation_seconds += time.perf_counter() - start
+        return counted
+
+    def _scored_relevant_moves(self, scored_relevant_moves):
+        def timed():
+            start = time.perf_counter()
+            try:
+                return scored_relevant_moves()
+            finally:
+                self.generation_seconds += time.perf_counter() - start
+        return timed
+
+    def _ordered_moves(self, ordered_moves):
+        def counted(tt_move, ply, player):
+            self.expanded_by_ply[ply] = self.expanded_by_ply.get(ply, 0) + 1
+            self._searched[ply] = 0
+            for move in ordered_moves(tt_move, ply, player):
+                self._searched[ply] += 1
+                self.moves_by_ply[ply] = self.moves_by_ply.get(ply, 0) + 1
+                yield move
+        return counted
+
+    def _record_cutoff(self, record_cutoff):
+        def counted(move, ply, player, depth):
+            self.cutoffs += 1
+            self.first_move_cutoffs += self._searched.get(ply) == 1
+            return record_cutoff(move, ply, player, depth)
+        return counted
+
+    def _timed_threats(self, solve):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return solve(*args, **kwargs)
+            finally:
+                self.threat_seconds += time.perf_counter() - start
+        return timed
@@ -0,0 +1,208 @@
+import time
+from Evaluator import PATTERN_SCORES, line_moves
+from Patterns import BROKEN_THREE, CLOSED_FOUR, OPEN_FOUR, FIVE
+
+# Attacker moves in a VCF line and threes (or fours) tried by a VCT
+VCF_DEPTH = 10
+VCT_DEPTH = 3
+# Nodes one solve may visit before giving up; an unfinished search proves nothing.
+# VCT nodes branch over every defence and cost far more than VCF nodes.
+VCF_NODES = 20000
+VCT_NODES = 1000
+# Score of a proven win, about what evaluate_board gives a finished five
+WIN_SCORE = 5 * PATTERN_SCORES[FIVE]
+
+
+class ThreatSolver:
+    """Victory by continuous fours (VCF) and threes (VCT) on a GomokuLogic board
+
+    Only threat moves and the replies they force are searched, so a forced
+    win 10-20 plies deep costs a few hundred nodes instead of a full-width
+    tree. Stones are placed with GomokuLogic._place and always taken back.
+    A returned line starts with the attacker's move and alternates with the
+    defender's forced replies; None means no win was proven.
+    """
+
+    def __init__(self, logic):
+        self.logic = logic
+        # (Zobrist key, attacker, kind, depth) -> (line or None, nodes it took); GomokuLogic clears it every move
+        self.cache = {}
+        self.nodes = 0
+        self.budget = 0
+
+    def vcf(self, attacker, depth=VCF_DEPTH, max_nodes=VCF_NODES):
+        """Forced win for attacker by playing only fours, or None"""
+        self.budget = max_nodes
+        return self._vcf(attacker, depth)
+
+    def vct(self, attacker, depth=VCT_DEPTH, max_nodes=VCT_NODES):
+        """Forced win for attacker by playing fours and threes, or None"""
+        self.budget = max_nodes
+        return self._vct(attacker, depth)
+
+    def _spent(self):
+        """Whether the node budget or the GomokuLogic deadline has run out, or the search was stopped"""
+        deadline = self.logic.deadline
+        if self.logic.stop_search or (deadline is not None and time.perf_counter() > deadline):
+            self.budget = 0
+        return self.budget <= 0
+
+    def _cached(self, key):
+        """A cached result, charged the nodes it took so results never depend on what is cached"""
+        result, cost = self.cache[key]
+        if cost > self.budget:
+            self.budget = 0
+            return None
+        self.budget -= cost
+        return result
+
+    def _vcf(self, attacker, depth):
+        evaluator = self.logic.evaluator
+        wins = evaluator.winning_cells(attacker)
+        if wins:
+            return [wins[0]]
+        # A defender five must be blocked, which a plain four does not do
+        if depth == 0 or evaluator.threats[3 - attacker]:
+            return None
+        key = (self.logic.zobrist_hash, attacker, "vcf", depth)
+        if key in self.cache:
+            return self._cached(key)
+        if self._spent():
+            return None
+        budget = self.budget
+        self.budget -= 1
+        self.nodes += 1
+
+        result = None
+        fours = evaluator.threat_moves(attacker, CLOSED_FOUR)
+        # Open fours first, they win on the spot
+        for move in sorted(fours, key=fours.get, reverse=True):
+            self.logic._place(move[0], move[1], attacker)
+            try:
+                result = self._after_four(attacker, move, depth)
+            finally:
+                self.logic._remove(move[0], move[1], attacker)
+            if result is not None or self.budget <= 0:
+                break
+        if result is not None or self.budget > 0:
+            self.cache[key] = (result, budget - self.budget)
+        return result
+
+    def _after_four(self, attacker, move, depth):
+        """Attacker's VCF continuation after the four at move, or None"""
+        replies = self.logic.evaluator.winning_cells(attacker)
+        if len(replies) >= 2:
+            return [move]
+        block = replies[0]
+        self.logic._place(block[0], block[1], 3 - attacker)
+        try:
+            line = self._vcf(attacker, depth - 1)
+        finally:
+            self.logic._remove(block[0], block[1], 3 - attacker)
+        return None if line is None else [move, block] + line
+
+    def _vct(self, attacker, depth):
+        evaluator = self.logic.evaluator
+        wins = evaluator.winning_cells(attacker)
+        if wins:
+            return [wins[0]]
+        counter = evaluator.winning_cells(3 - attacker)
+        if len(counter) >= 2:
+            return None
+        if counter:
+            # Block the defender's four; the attacker's threats must then still hold
+            block = counter[0]
+            self.logic._place(block[0], block[1], attacker)
+            try:
+                line = self._defend(attacker, depth)
+            finally:
+                self.logic._remove(block[0], block[1], attacker)
+            return None if line is None else [block] + line
+        line = self._vcf(attacker, VCF_DEPTH)
+        if line is not None or depth == 0:
+            return line
+        key = (self.logic.zobrist_hash, attacker, "vct", depth)
+        if key in self.cache:
+            return self._cached(key)
+        if self._spent():
+            return None
+        budget = self.budget
+        self.budget -= 1
+        self.nodes += 1
+
+        result = None
+        threats = evaluator.threat_moves(attacker, BROKEN_THREE)
+        for move in sorted(threats, key=threats.get, reverse=True):
+            self.logic._place(move[0], move[1], attacker)
+            try:
+                line = self._defend(attacker, depth - 1)
+            finally:
+                self.logic._remove(move[0], move[1], attacker)
+            if line is not None:
+                result = [move] + line
+                break
+            if self.budget <= 0:
+                break
+        if result is not None or self.budget > 0:
+            self.cache[key] = (result, budget - self.budget)
+        return result
+
+    def _defend(self, attacker, depth):
+        """With the defender to move, attacker's line against the first defence if every defence fails"""
+        evaluator = self.logic.evaluator
+        defender = 3 - attacker
+        if evaluator.threats[defender] or self._spent():
+            return None
+        self.budget -= 1
+        self.nodes += 1
+        fours = evaluator.winning_cells(attacker)
+        if len(fours) >= 2:
+            return []
+        if fours:
+            defences = fours
+        else:
+            defences = self._three_defences(attacker)
+            if not defences:
+                # The last move threatened nothing, the defender has a free move
+                return None
+            # Counter-fours gain the defender a tempo
+            defences += [move for move in evaluator.threat_moves(defender, CLOSED_FOUR) if move not in defences]
+
+        line = None
+        for move in defences:
+            if self.budget <= 0:
+                return None
+            self.logic._place(move[0], move[1], defender)
+            try:
+                sub = self._vct(attacker, depth)
+            finally:
+                self.logic._remove(move[0], move[1], defender)
+            if sub is None:
+                return None
+            if line is None:
+                line = [move] + sub
+        return line
+
+    def _three_defences(self, attacker):
+        """Empty cells where a defender stone takes away one of attacker's open-four moves"""
+        evaluator = self.logic.evaluator
+        board = self.logic.board
+        defender = 3 - attacker
+        defences = []
+        for line, code in enumerate(evaluator.codes):
+            if not any(pattern >= OPEN_FOUR for _, pattern in line_moves(code, attacker)):
+                continue
+            for row, col in evaluator.line_cells[line]:
+                if board[row][col] == 0 and (row, col) not in defences and self._blocks(row, col, attacker, defender):
+                    defences.append((row, col))
+        return defences
+
+    def _blocks(self, row, col, attacker, defender):
+        evaluator = self.logic.evaluator
+        for line, shift in evaluator.cell_lines[row][col]:
+            code = evaluator.codes[line]
+            before = [move for move in line_moves(code, attacker) if move[1] >= OPEN_FOUR]
+            if before and before != [move for move in line_moves(code + (defender << shift), attacker)
+                                     if move[1] >= OPEN_FOUR]:
+                return True
+        return False
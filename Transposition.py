@@ -0,0 +1,72 @@
+# Bound types of a stored score
+EXACT = 0
+LOWER = 1  # Search failed high: the true score is at least the stored one
+UPPER = 2  # Search failed low: the true score is at most the stored one
+
+# Rough Python memory cost of one filled slot, used to size a table given in MB
+ENTRY_BYTES = 120
+DEFAULT_ENTRIES = 1 << 18
+
+
+class TranspositionTable:
+    """Fixed-capacity table of two-slot buckets
+
+    Slot 0 of a bucket keeps the deepest search seen (depth-preferred),
+    slot 1 always takes the newest entry that did not fit in slot 0.
+    """
+
+    def __init__(self, entries=None, megabytes=None):
+        if entries is None:
+            entries = int(megabytes * 2 ** 20 / ENTRY_BYTES) if megabytes else DEFAULT_ENTRIES
+        buckets = 1
+        while buckets * 4 <= entries:
+            buckets *= 2
+        self.bucket_mask = buckets - 1
+        self.capacity = buckets * 2
+        self.clear()
+
+    def clear(self):
+        # Parallel lists keep the per-entry overhead to a few pointers
+        self.keys = [None] * self.capacity
+        self.depths = [0] * self.capacity
+        self.flags = [EXACT] * self.capacity
+        self.scores = [0] * self.capacity
+        self.moves = [None] * self.capacity
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def __len__(self):
+        return self.capacity - self.keys.count(None)
+
+    def probe(self, key):
+        """(depth, flag, score, best move) stored for key, or None"""
+        self.probes += 1
+        slot = (key & self.bucket_mask) << 1
+        if self.keys[slot] != key:
+            slot += 1
+            if self.keys[slot] != key:
+                return None
+        self.hits += 1
+        return self.depths[slot], self.flags[slot], self.scores[slot], self.moves[slot]
+
+    def store(self, key, depth, flag, score, move):
+        self.stores += 1
+        slot = (key & self.bucket_mask) << 1
+        keys = self.keys
+        if keys[slot] is not None and keys[slot] != key and self.depths[slot] > depth:
+            # Keep the deeper entry, overwrite the always-replace slot
+            slot += 1
+        elif keys[slot] != key and keys[slot] is not None:
+            # Demote the shallower entry instead of dropping it
+            self._write(slot + 1, keys[slot], self.depths[slot], self.flags[slot], self.scores[slot], self.moves[slot])
+        elif keys[slot + 1] == key:
+            keys[slot + 1] = None
+        self._write(slot, key, depth, flag, score, move)
+
+    def _write(self, slot, key, depth, flag, score, move):
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.flags[slot] = flag
+        self.scores[slot] = score
+        self.moves[slot] = move
@@ -1,15 +1,37 @@
 import pygame
 import time
 import os
-from Logic import GomokuLogic
+import platform
+import sys
+import threading
+import traceback
+from Logic import GomokuLogic, SearchTimeout
+from GameRecord import GameWriter, DRAW, UNFINISHED, MAX_SIZE
+
+# Time budget for one AI move; the search deepens until it runs out
+AI_TIME_LIMIT_MS = 500
+# The browser build has no threads, so there the AI searches between frames
+THREADED_AI = platform.system() != "Emscripten"
+# How long the search thread may hold the GIL while the render loop waits for it
+GIL_SWITCH_SECONDS = 0.001
+# While the player thinks, the AI searches its reply to the move it expects, for at most
+# Logic.PONDER_LIMIT_MS so an idle game goes quiet again; needs threads
+PONDER = THREADED_AI
+# Board sizes offered on the start screen; the first is the default
+BOARD_SIZES = (10, 15, 19)
+# The board area is this many pixels square and cells shrink to fit bigger boards
+BOARD_PIXELS = 600
+# Every game played is appended here (see GameRecord.py)
+RECORD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "games.gmr")
 
 class GomokuGame:
     def __init__(self):
         pygame.init()
-        self.cell_size = 60
-        self.board_size = 10 * self.cell_size
-        self.screen_width = self.board_size
-        self.screen_height = self.board_size + 100
+        if THREADED_AI:
+            sys.setswitchinterval(GIL_SWITCH_SECONDS)
+        self.set_board_cells(BOARD_SIZES[0])
+        self.screen_width = BOARD_PIXELS
+        self.screen_height = BOARD_PIXELS + 100
         self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
         pygame.display.set_caption("Gomoku")
         
@@ -50,11 +72,28 @@ class GomokuGame:
         
         self.state = "start"
         self.game = None
+        # The AI searches its own copy of the game so the displayed board never
+        # shows the stones it tries; its transposition table lasts the whole game
+        self.engine = None
+        self.thinking = False
+        self.ai_result = None  # (engine, move, seconds, error) posted by the search; error is None unless it failed
+        self.ponder = None  # (engine, expected move, thread) while pondering
         self.status = ""
-        self.restart_button = pygame.Rect(self.screen_width - 140, self.screen_height - 80, 120, 40)
-        self.menu_button = pygame.Rect(self.screen_width - 280, self.screen_height - 80, 120, 40)
+        self.undo_button = pygame.Rect(20, self.screen_height - 50, 120, 40)
+        self.redo_button = pygame.Rect(160, self.screen_height - 50, 120, 40)
+        self.menu_button = pygame.Rect(self.screen_width - 280, self.screen_height - 50, 120, 40)
+        self.restart_button = pygame.Rect(self.screen_width - 140, self.screen_height - 50, 120, 40)
+        self.game_buttons = [("Undo", self.undo_button), ("Redo", self.redo_button), ("Menu", self.menu_button),
+                             ("Restart", self.restart_button)]
+        self.redo_moves = []  # (move, player) taken back by Undo, the next one to replay last
+        try:
+            self.records = GameWriter(RECORD_PATH)
+        except OSError as e:
+            print(f"Cannot record games to {RECORD_PATH}: {e}")
+            self.records = None
         self.pvai_button = pygame.Rect(self.screen_width // 2 - 150, self.screen_height // 2 - 80, 300, 50)
         self.pvp_button = pygame.Rect(self.screen_width // 2 - 150, self.screen_height // 2 + 10, 300, 50)
+        self.size_button = pygame.Rect(self.screen_width // 2 - 150, self.screen_height // 2 + 100, 300, 50)
         self.button_alpha = 0
         self.title_alpha = 0
         self.button_scale = 1.0
@@ -72,6 +111,29 @@ class GomokuGame:
             "text": (200, 191, 255),
             "hover_tile": (0, 191, 255, 128)
         }
+        # Render caches for draw_board: the grid is drawn once per board size,
+        # stones are added to a copy of it as they are played, and buttons,
+        # hover stones and the status line are rendered once per state
+        self.grid_layer = None  # (board size, surface)
+        self.stone_layer = None
+        self.layer_game = None
+        self.layer_stones = 0
+        self.layer_moves = []
+        self.layer_strike = False
+        self.board_frame = None  # Stone layer flattened onto the background once the fade-in ends
+        self.button_surfaces = {}
+        self.status_cache = (None, None, None)
+        # frame_state() of the picture on the display; None forces a full redraw
+        self.shown_state = None
+        self.idle = False
+
+    def set_board_cells(self, cells):
+        """Use a cells x cells board from the next game on"""
+        self.board_cells = cells
+        self.cell_size = BOARD_PIXELS // cells
+        self.board_size = cells * self.cell_size
+        self.stone_radius = self.cell_size * 5 // 12  # 25 pixels on the 60-pixel cells of a 10x10 board
+        self.hover_surfaces = {}
 
     def draw_start_screen(self):
         self.screen.blit(self.background, (0, 0))  # Draw background image or gradient
@@ -107,170 +169,434 @@ class GomokuGame:
         scaled_pvp = pygame.transform.scale(pvp_surface, (int(300 * pvp_scale), int(50 * pvp_scale)))
         self.screen.blit(scaled_pvai, (self.screen_width // 2 - int(150 * pvai_scale), self.screen_height // 2 - int(80 * pvai_scale)))
         self.screen.blit(scaled_pvp, (self.screen_width // 2 - int(150 * pvp_scale), self.screen_height // 2 - int(25 * pvp_scale)))
+        size_surface = pygame.Surface((300, 50), pygame.SRCALPHA)
+        size_hovered = self.size_button.collidepoint(mouse_pos)
+        size_color = self.colors["button_hover"] if size_hovered else self.colors["button_normal"]
+        size_scale = 1.1 if size_hovered else self.button_scale
+        pygame.draw.rect(size_surface, (*size_color, int(self.button_alpha)), (0, 0, 300, 50), border_radius=10)
+        size_text = self.button_font.render(f"Board {self.board_cells}x{self.board_cells}", True, self.colors["text"])
+        size_surface.blit(size_text, (150 - size_text.get_width() // 2, 25 - size_text.get_height() // 2))
+        scaled_size = pygame.transform.scale(size_surface, (int(300 * size_scale), int(50 * size_scale)))
+        self.screen.blit(scaled_size, (self.size_button.centerx - int(150 * size_scale),
+                                       self.size_button.centery - int(25 * size_scale)))
 
-    def draw_board(self):
-        self.screen.fill(self.colors["bg"])
-        board_surface = pygame.Surface((self.board_size, self.board_size), pygame.SRCALPHA)
-        if self.board_alpha < 255:
-            self.board_alpha += 255 * (1 / 60)
-        for i in range(self.game.size):
-            pygame.draw.line(board_surface, self.colors["board_lines_glow"],
+    def render_grid(self, size):
+        """Transparent board surface with the glowing grid lines, drawn once per board size"""
+        grid = pygame.Surface((self.board_size, self.board_size), pygame.SRCALPHA)
+        for i in range(size):
+            pygame.draw.line(grid, self.colors["board_lines_glow"],
                              (0, i * self.cell_size), (self.board_size, i * self.cell_size), 5)
-            pygame.draw.line(board_surface, self.colors["board_lines_glow"],
+            pygame.draw.line(grid, self.colors["board_lines_glow"],
                              (i * self.cell_size, 0), (i * self.cell_size, self.board_size), 5)
-            pygame.draw.line(board_surface, self.colors["board_lines"],
+            pygame.draw.line(grid, self.colors["board_lines"],
                              (0, i * self.cell_size), (self.board_size, i * self.cell_size), 3)
-            pygame.draw.line(board_surface, self.colors["board_lines"],
+            pygame.draw.line(grid, self.colors["board_lines"],
                              (i * self.cell_size, 0), (i * self.cell_size, self.board_size), 3)
-        for row in range(self.game.size):
-            for col in range(self.game.size):
-                if self.game.board[row][col] == 1:
-                    pygame.draw.circle(board_surface, self.colors["player1"],
-                                       (col * self.cell_size + self.cell_size // 2,
-                                        row * self.cell_size + self.cell_size // 2), 25)
-                elif self.game.board[row][col] == 2:
-                    pygame.draw.circle(board_surface, self.colors["player2"],
-                                       (col * self.cell_size + self.cell_size // 2,
-                                        row * self.cell_size + self.cell_size // 2), 25)
-                    pygame.draw.circle(board_surface, self.colors["player2_outline"],
-                                       (col * self.cell_size + self.cell_size // 2,
-                                        row * self.cell_size + self.cell_size // 2), 25, 2)
-        mouse_x, mouse_y = pygame.mouse.get_pos()
+        return grid
+
+    def cell_center(self, row, col):
+        return (col * self.cell_size + self.cell_size // 2, row * self.cell_size + self.cell_size // 2)
+
+    def draw_stone(self, surface, row, col, player):
+        center = self.cell_center(row, col)
+        if player == 1:
+            pygame.draw.circle(surface, self.colors["player1"], center, self.stone_radius)
+        elif player == 2:
+            pygame.draw.circle(surface, self.colors["player2"], center, self.stone_radius)
+            pygame.draw.circle(surface, self.colors["player2_outline"], center, self.stone_radius, 2)
+
+    def update_stone_layer(self):
+        """Bring the cached grid-and-stones surface up to date with self.game
+
+        Only stones played since the last frame are drawn; a new game, or a
+        history that no longer starts with the drawn stones (Undo), starts
+        again from the grid.
+        """
+        history = self.game.move_history
+        if (self.layer_game is not self.game or self.layer_stones > len(history) or
+                history[:self.layer_stones] != self.layer_moves):
+            if self.grid_layer is None or self.grid_layer[0] != self.game.size:
+                self.grid_layer = (self.game.size, self.render_grid(self.game.size))
+            self.stone_layer = self.grid_layer[1].copy()
+            self.layer_game = self.game
+            self.layer_stones = 0
+            self.layer_strike = False
+            self.board_frame = None
+        for row, col in history[self.layer_stones:]:
+            self.draw_stone(self.stone_layer, row, col, self.game.board[row][col])
+            self.board_frame = None
+        self.layer_stones = len(history)
+        self.layer_moves = list(history)
+        # Strike-through line for the winning sequence, drawn once the game is won
+        sequence = self.game.winning_sequence
+        if (not self.layer_strike and self.game.game_over and self.game.winner is not None and sequence and
+                len(sequence) >= 5):
+            pygame.draw.line(self.stone_layer, (255, 0, 0), self.cell_center(*sequence[0]),
+                             self.cell_center(*sequence[-1]), 5)
+            self.layer_strike = True
+            self.board_frame = None
+
+    def hover_surface(self, player):
+        """Translucent stone shown under the mouse, rendered once per player"""
+        if player not in self.hover_surfaces:
+            color = self.colors["hover_tile"] if player == 1 else (*self.colors["player2"], 128)
+            surface = pygame.Surface((self.cell_size, self.cell_size), pygame.SRCALPHA)
+            pygame.draw.circle(surface, color, (self.cell_size // 2, self.cell_size // 2), self.stone_radius)
+            self.hover_surfaces[player] = surface
+        return self.hover_surfaces[player]
+
+    def button_surface(self, label, hovered):
+        """Button of the game screen as drawn for its hover state, scaled up by 10% when hovered"""
+        key = (label, hovered)
+        if key not in self.button_surfaces:
+            surface = pygame.Surface((120, 40), pygame.SRCALPHA)
+            color = self.colors["button_hover"] if hovered else self.colors["button_normal"]
+            pygame.draw.rect(surface, color, (0, 0, 120, 40), border_radius=10)
+            text = self.button_font.render(label, True, self.colors["text"])
+            surface.blit(text, (60 - text.get_width() // 2, 20 - text.get_height() // 2))
+            scale = 1.1 if hovered else 1.0
+            self.button_surfaces[key] = pygame.transform.scale(surface, (int(120 * scale), int(40 * scale)))
+        return self.button_surfaces[key]
+
+    def status_surfaces(self, status):
+        """Status text and its shadow, rendered again only when the text changes"""
+        if self.status_cache[0] != status:
+            self.status_cache = (status, self.status_font.render(status, True, self.colors["text"]),
+                                 self.status_font.render(status, True, (0, 0, 0)))
+        return self.status_cache[1:]
+
+    def hover_cell(self, mouse_pos):
+        """Empty cell under the mouse that would get a hover stone, or None"""
+        mouse_x, mouse_y = mouse_pos
         if mouse_y < self.board_size and not self.game.game_over:
             row = mouse_y // self.cell_size
             col = mouse_x // self.cell_size
             if self.game.is_valid_move(row, col):
-                hover_color = self.colors["hover_tile"] if self.game.current_player == 1 else (*self.colors["player2"], 128)
-                pygame.draw.circle(board_surface, hover_color,
-                                   (col * self.cell_size + self.cell_size // 2,
-                                    row * self.cell_size + self.cell_size // 2), 25)
-
-        # Draw strike-through line for winning sequence
-        if self.game.game_over and self.game.winner is not None and hasattr(self.game, 'winning_sequence'):
-            if self.game.winning_sequence and len(self.game.winning_sequence) >= 5:
-                # Get the first and last points of the winning sequence
-                start_pos = self.game.winning_sequence[0]
-                end_pos = self.game.winning_sequence[-1]
-                # Convert board coordinates to pixel coordinates (center of cells)
-                start_x = start_pos[1] * self.cell_size + self.cell_size // 2
-                start_y = start_pos[0] * self.cell_size + self.cell_size // 2
-                end_x = end_pos[1] * self.cell_size + self.cell_size // 2
-                end_y = end_pos[0] * self.cell_size + self.cell_size // 2
-                # Draw the strike-through line
-                pygame.draw.line(board_surface, (255, 0, 0), (start_x, start_y), (end_x, end_y), 5)
-
-        board_surface.set_alpha(int(self.board_alpha))
-        self.screen.blit(board_surface, (0, 0))
-        status_text = self.status_font.render(self.status, True, self.colors["text"])
-        shadow_text = self.status_font.render(self.status, True, (0, 0, 0))
+                return (row, col)
+        return None
+
+    def shown_status(self):
+        if self.thinking:
+            return self.status + "." * (int(time.time() * 3) % 4)
+        return self.status
+
+    def frame_state(self):
+        """Everything the next frame's picture depends on; an unchanged state needs no redraw"""
+        mouse_pos = pygame.mouse.get_pos()
+        if self.state == "start":
+            animating = time.time() - self.animation_start < 0.5
+            return ("start", self.pvai_button.collidepoint(mouse_pos), self.pvp_button.collidepoint(mouse_pos),
+                    self.size_button.collidepoint(mouse_pos), self.board_cells, time.time() if animating else None)
+        return ("game", self.game, tuple(self.game.move_history), self.game.game_over,
+                min(255, int(self.board_alpha)), self.hover_cell(mouse_pos), self.game.current_player,
+                tuple(button.collidepoint(mouse_pos) for _, button in self.game_buttons), self.shown_status())
+
+    def dirty_rects(self, old, new):
+        """Screen areas that differ between frames drawn for the states old and new, or None for all of it"""
+        if (old is None or old[0] != "game" or new[0] != "game" or old[1] is not new[1] or
+                new[2][:len(old[2])] != old[2] or old[3] != new[3] or old[4] < 255 or new[4] < 255):
+            return None
+        size = self.cell_size
+        rects = [pygame.Rect(col * size, row * size, size, size) for row, col in new[2][len(old[2]):]]
+        if old[5:7] != new[5:7]:
+            rects += [pygame.Rect(cell[1] * size, cell[0] * size, size, size) for cell in (old[5], new[5]) if cell]
+        for (_, button), was_hovered, hovered in zip(self.game_buttons, old[7], new[7]):
+            if was_hovered != hovered:
+                # The button as drawn both plain and hovered (scaled up)
+                rects.append(button.inflate(button.width // 10 + 2, button.height // 10 + 2))
+        if old[8] != new[8]:
+            rects.append(pygame.Rect(0, self.board_size, self.screen_width, self.screen_height - self.board_size))
+        return rects
+
+    def draw_board(self):
+        self.update_stone_layer()
+        if self.board_alpha < 255:
+            self.board_alpha += 255 * (1 / 60)
+            self.screen.fill(self.colors["bg"])
+            self.stone_layer.set_alpha(int(self.board_alpha))
+            self.screen.blit(self.stone_layer, (0, 0))
+        else:
+            # Fully faded in: one opaque copy instead of blending the layer every frame
+            if self.board_frame is None:
+                self.board_frame = pygame.Surface((self.board_size, self.board_size)).convert()
+                self.board_frame.fill(self.colors["bg"])
+                self.stone_layer.set_alpha(255)
+                self.board_frame.blit(self.stone_layer, (0, 0))
+            self.screen.blit(self.board_frame, (0, 0))
+            self.screen.fill(self.colors["bg"], (0, self.board_size, self.screen_width,
+                                                 self.screen_height - self.board_size))
+        mouse_pos = pygame.mouse.get_pos()
+        cell = self.hover_cell(mouse_pos)
+        if cell:
+            row, col = cell
+            hover = self.hover_surface(self.game.current_player)
+            hover.set_alpha(min(255, int(self.board_alpha)))  # Fades in with the board
+            self.screen.blit(hover, (col * self.cell_size, row * self.cell_size))
+
+        status_text, shadow_text = self.status_surfaces(self.shown_status())
         self.screen.blit(shadow_text, (12, self.board_size + 12))
         self.screen.blit(status_text, (10, self.board_size + 10))
-        mouse_pos = pygame.mouse.get_pos()
-        restart_color = self.colors["button_hover"] if self.restart_button.collidepoint(mouse_pos) else self.colors["button_normal"]
-        restart_surface = pygame.Surface((120, 40), pygame.SRCALPHA)
-        restart_scale = 1.1 if self.restart_button.collidepoint(mouse_pos) else 1.0
-        pygame.draw.rect(restart_surface, restart_color, (0, 0, 120, 40), border_radius=10)
-        restart_text = self.button_font.render("Restart", True, self.colors["text"])
-        restart_surface.blit(restart_text, (60 - restart_text.get_width() // 2, 20 - restart_text.get_height() // 2))
-        scaled_restart = pygame.transform.scale(restart_surface, (int(120 * restart_scale), int(40 * restart_scale)))
-        self.screen.blit(scaled_restart, (self.screen_width - int(140 * restart_scale), self.screen_height - int(80 * restart_scale)))
-        menu_color = self.colors["button_hover"] if self.menu_button.collidepoint(mouse_pos) else self.colors["button_normal"]
-        menu_surface = pygame.Surface((120, 40), pygame.SRCALPHA)
-        menu_scale = 1.1 if self.menu_button.collidepoint(mouse_pos) else 1.0
-        pygame.draw.rect(menu_surface, menu_color, (0, 0, 120, 40), border_radius=10)
-        menu_text = self.button_font.render("Menu", True, self.colors["text"])
-        menu_surface.blit(menu_text, (60 - menu_text.get_width() // 2, 20 - menu_text.get_height() // 2))
-        scaled_menu = pygame.transform.scale(menu_surface, (int(120 * menu_scale), int(40 * menu_scale)))
-        self.screen.blit(scaled_menu, (self.screen_width - int(280 * menu_scale), self.screen_height - int(80 * menu_scale)))
+        for label, button in self.game_buttons:
+            surface = self.button_surface(label, button.collidepoint(mouse_pos))
+            self.screen.blit(surface, surface.get_rect(center=button.center))
 
     def handle_click(self, pos):
         if self.state == "start":
             if self.pvai_button.collidepoint(pos):
-                self.game = GomokuLogic(size=10, game_mode="Player VS AI")
+                self.game = GomokuLogic(size=self.board_cells, game_mode="Player VS AI")
+                self.engine = GomokuLogic(size=self.board_cells, game_mode="Player VS AI")
+                self.start_record()
                 self.state = "game"
                 self.status = "Player's Turn"
                 self.board_alpha = 0
             elif self.pvp_button.collidepoint(pos):
-                self.game = GomokuLogic(size=10, game_mode="Player VS Player")
+                self.game = GomokuLogic(size=self.board_cells, game_mode="Player VS Player")
+                self.engine = None
+                self.start_record()
                 self.state = "game"
                 self.status = "Player 1's Turn"
                 self.board_alpha = 0
+            elif self.size_button.collidepoint(pos):
+                sizes = list(BOARD_SIZES)
+                self.set_board_cells(sizes[(sizes.index(self.board_cells) + 1) % len(sizes)])
         elif self.state == "game":
             if self.restart_button.collidepoint(pos):
                 print("Restart button clicked")
-                self.game = GomokuLogic(size=10, game_mode=self.game.game_mode)
+                self.cancel_ai()
+                self.game = GomokuLogic(size=self.board_cells, game_mode=self.game.game_mode)
+                if self.game.game_mode == "Player VS AI":
+                    self.engine = GomokuLogic(size=self.board_cells, game_mode=self.game.game_mode)
+                self.start_record()
                 self.status = "Player's Turn" if self.game.game_mode == "Player VS AI" else "Player 1's Turn"
                 self.board_alpha = 0
+                self.redo_moves = []
                 return
             if self.menu_button.collidepoint(pos):
                 print("Menu button clicked")
+                self.cancel_ai()
+                if self.records:
+                    self.records.finish(UNFINISHED)
                 self.game = None
+                self.engine = None
+                self.redo_moves = []
                 self.state = "start"
                 self.status = ""
                 self.button_alpha = 0
                 self.title_alpha = 0
                 self.animation_start = time.time()
                 return
-            if self.game.game_over:
+            if self.undo_button.collidepoint(pos):
+                self.undo()
+                return
+            if self.redo_button.collidepoint(pos):
+                self.redo()
+                return
+            if self.game.game_over or self.thinking:
                 return
             x, y = pos
             if y < self.board_size:
                 row = y // self.cell_size
                 col = x // self.cell_size
-                if self.game.make_move(row, col, self.game.current_player):
+                if self.game.is_valid_move(row, col):
                     print(f"Player {self.game.current_player} moved at ({row}, {col})")
-                    if self.game.check_winner(self.game.current_player):
-                        self.status = "Player Wins!" if self.game.game_mode == "Player VS AI" and self.game.current_player == 1 else "AI Wins!" if self.game.game_mode == "Player VS AI" else f"Player {self.game.current_player} Wins!"
-                        self.game.game_over = True
-                        self.game.winner = self.game.current_player
-                        print(f"Winner: Player {self.game.current_player}")
-                    elif self.game.is_board_full():
-                        self.status = "Draw!"
-                        self.game.game_over = True
-                        print("Game ended in a draw")
-                    else:
-                        self.game.current_player = 2 if self.game.current_player == 1 else 1
-                        self.status = "AI's Turn" if self.game.game_mode == "Player VS AI" and self.game.current_player == 2 else "Player's Turn" if self.game.game_mode == "Player VS AI" else f"Player {self.game.current_player}'s Turn"
-                        print(f"Next turn: {self.status}")
-                        if self.game.game_mode == "Player VS AI" and self.game.current_player == 2:
-                            self.ai_move()
+                    self.stop_ponder()
+                    self.redo_moves = []
+                    self.play_move(row, col, self.game.current_player)
+                    if self.game.game_mode == "Player VS AI" and self.game.current_player == 2 and not self.game.game_over:
+                        self.ai_move()
+
+    def start_record(self):
+        """Record the new self.game; a game left unfinished before it is saved as such"""
+        if not self.records:
+            return
+        self.records.finish(UNFINISHED)
+        # One byte per move only covers boards up to MAX_SIZE, so bigger games go unrecorded
+        if self.board_cells <= MAX_SIZE:
+            self.records.start(self.board_cells, self.game.game_mode)
+            self.game.recorder = self.records
+
+    def turn_status(self):
+        if self.game.game_mode == "Player VS AI":
+            return "AI's Turn" if self.game.current_player == 2 else "Player's Turn"
+        return f"Player {self.game.current_player}'s Turn"
+
+    def play_move(self, row, col, player):
+        """Play a valid move on the displayed game and the AI's engine, then settle a win, a draw or the next turn"""
+        self.game.make_move(row, col, player)
+        if self.engine:
+            self.engine.make_move(row, col, player)
+        if self.game.check_winner(player):
+            if self.game.game_mode == "Player VS AI":
+                self.status = "Player Wins!" if player == 1 else "AI Wins!"
+            else:
+                self.status = f"Player {player} Wins!"
+            self.game.game_over = True
+            self.game.winner = player
+            if self.game.recorder:
+                self.game.recorder.finish(player)
+            print(f"Winner: Player {player}")
+        elif self.game.is_board_full():
+            self.status = "Draw!"
+            self.game.game_over = True
+            if self.game.recorder:
+                self.game.recorder.finish(DRAW)
+            print("Game ended in a draw")
+        else:
+            self.game.current_player = 2 if player == 1 else 1
+            self.status = self.turn_status()
+            print(f"Next turn: {self.status}")
+
+    def undo(self):
+        """Take back the last move; against the AI, take back its reply and the player's move before it"""
+        if self.thinking or not self.game.move_history:
+            return
+        self.stop_ponder()
+        while self.game.move_history:
+            move, player = self.game.pop()
+            if self.game.recorder:
+                self.game.recorder.undo()
+            if self.engine:
+                self.engine.pop()
+            self.redo_moves.append((move, player))
+            print(f"Undid player {player} at {move}")
+            # The AI never gets the turn back, so keep going until it is the player's
+            if not self.engine or player == 1:
+                break
+        self.status = self.turn_status()
+        self.start_ponder()
+
+    def redo(self):
+        """Replay what undo took back, the AI's reply included"""
+        if self.thinking or not self.redo_moves:
+            return
+        self.stop_ponder()
+        while self.redo_moves:
+            (row, col), player = self.redo_moves.pop()
+            print(f"Redid player {player} at ({row}, {col})")
+            self.play_move(row, col, player)
+            if self.game.game_over or not self.engine or self.game.current_player == 1:
+                break
+        if self.engine and self.game.current_player == 2 and not self.game.game_over:
+            self.ai_move()
+        else:
+            self.start_ponder()
 
     def ai_move(self):
         if self.game.game_mode != "Player VS AI" or self.game.current_player != 2:
             print("AI move skipped: Wrong mode or turn")
             return
+        self.thinking = True
+        self.status = "Thinking"
+        if THREADED_AI:
+            threading.Thread(target=self.search_ai_move, args=(self.engine,), daemon=True).start()
+        # Otherwise update_loop runs the search once a frame has shown the status
+
+    def search_ai_move(self, engine):
+        """Search engine for the AI move and post it to update_loop; runs in the worker thread"""
         start_time = time.time()
-        move = self.game.find_best_move(depth=2)
-        end_time = time.time()
+        try:
+            move = engine.find_best_move(time_limit_ms=AI_TIME_LIMIT_MS)
+        except SearchTimeout:
+            return  # Stopped by cancel_ai
+        except Exception as error:
+            # Post the failure too, or the game would wait on "Thinking" forever
+            traceback.print_exc()
+            self.ai_result = (engine, None, time.time() - start_time, error)
+            return
+        self.ai_result = (engine, move, time.time() - start_time, None)
+
+    def cancel_ai(self):
+        """Stop a running AI search or ponder and drop its result"""
+        self.stop_ponder()
+        if self.engine:
+            self.engine.stop_search = True
+        self.thinking = False
+        self.ai_result = None
+
+    def start_ponder(self):
+        """Search the AI's reply to the player's expected move in the background until the player moves
+
+        The thread ends by itself after Logic.PONDER_LIMIT_MS. If the player
+        then plays that move, the AI's search picks up where the ponder
+        stopped (see GomokuLogic.ponder).
+        """
+        if not PONDER or not self.engine or self.thinking or self.ponder or self.game.game_over:
+            return
+        if self.game.current_player != 1:
+            return
+        move = self.engine.predicted_reply()
+        if move is None:
+            return
+        thread = threading.Thread(target=self.engine.ponder, args=(move,), daemon=True)
+        self.ponder = (self.engine, move, thread)
+        thread.start()
+
+    def stop_ponder(self):
+        """Stop pondering and wait for the search to unwind, so the engine can be played on"""
+        if not self.ponder:
+            return
+        engine, _, thread = self.ponder
+        self.ponder = None
+        engine.stop_search = True
+        thread.join()
+        engine.stop_search = False
+
+    def apply_ai_move(self, move, elapsed):
+        self.thinking = False
         if move:
             row, col = move
-            self.game.make_move(row, col, 2)
-            print(f"AI moved at ({row}, {col}) in {end_time - start_time:.2f}s")
-            if self.game.check_winner(2):
-                self.status = "AI Wins!"
-                self.game.game_over = True
-                self.game.winner = 2
-                print("AI wins")
-            elif self.game.is_board_full():
-                self.status = "Draw!"
-                self.game.game_over = True
-                print("Game ended in a draw")
-            else:
-                self.game.current_player = 1
-                self.status = "Player's Turn"
-                print("Player's turn")
+            print(f"AI moved at ({row}, {col}) in {elapsed:.2f}s")
+            if self.game.recorder:
+                self.game.recorder.ai_time(elapsed)
+            self.play_move(row, col, 2)
+            self.start_ponder()
         else:
             print("No valid AI move found")
 
-    def update_loop(self):
-        for event in pygame.event.get():
+    def update_loop(self, idle_wait_ms=0):
+        """Handle events and draw one frame, pushing only the parts of the screen that changed
+
+        With idle_wait_ms, a call that finds nothing to do blocks for up to
+        that long waiting for the next event instead of returning at once.
+        """
+        if self.thinking and not THREADED_AI:
+            self.search_ai_move(self.engine)
+        if self.ai_result is not None:
+            engine, move, elapsed, error = self.ai_result
+            self.ai_result = None
+            # A result for an engine replaced by Restart or Menu is stale
+            if engine is self.engine:
+                if error is None:
+                    self.apply_ai_move(move, elapsed)
+                else:
+                    self.thinking = False
+                    self.status = "AI error"
+        events = pygame.event.get()
+        if not events and idle_wait_ms and self.idle:
+            # Nothing has changed since the last frame and nothing is running: sleep until an event
+            event = pygame.event.wait(idle_wait_ms)
+            events = [event] if event.type != pygame.NOEVENT else []
+        for event in events:
             if event.type == pygame.QUIT:
+                if self.records:
+                    self.records.close()
                 pygame.quit()
                 return
             if event.type == pygame.MOUSEBUTTONDOWN:
                 self.handle_click(event.pos)
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                self.shown_state = None
+        state = self.frame_state()
+        self.idle = state == self.shown_state and not self.thinking and self.ai_result is None
+        if state == self.shown_state:
+            return
         if self.state == "start":
             self.draw_start_screen()
         else:
             self.draw_board()
-        pygame.display.flip()
\ No newline at end of file
+        rects = self.dirty_rects(self.shown_state, state)
+        if rects is None:
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
+        self.shown_state = state
\ No newline at end of file